@@ -0,0 +1,195 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from instrumentation import span
+
+# Сохраненное состояние предобработки каталога: словари кодов категориальных столбцов,
+# мода для заполнения пропусков и границы MinMax-нормализации признаков. С ним новые ноутбуки
+# кодируются и нормализуются так же, как уже загруженные, без повторного обучения LabelEncoder
+# и MinMaxScaler на всем каталоге.
+
+STATE_FILE = 'catalog_state.json'
+CATEGORICAL_COLUMNS = ['RAM_Type', 'Proc_Manufacturer', 'Proc_Series', 'OS_Name', 'Warranty_Type']
+FILL_COLUMNS = ['Proc_Cores']
+DRIFT_THRESHOLD = 0.1  # допустимый выход признака за сохраненный диапазон, в долях диапазона
+
+
+def state_path_for(catalog_csv):
+    # Состояние лежит рядом с файлом каталога
+    return os.path.join(os.path.dirname(catalog_csv), STATE_FILE)
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(state, path):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    print(f"Состояние каталога сохранено в файл: {path}")
+
+
+def fit_scaler_state(df, features, catalog_csv):
+    """Границы MinMax-нормализации, как у MinMaxScaler.fit (пропуски не учитываются)"""
+    values = df[features].to_numpy(dtype=np.float64)
+    return {
+        'catalog': os.path.basename(catalog_csv),
+        'features': list(features),
+        'min': np.nanmin(values, axis=0).tolist(),
+        'max': np.nanmax(values, axis=0).tolist(),
+    }
+
+
+def load_scaler_state(catalog_csv, features):
+    # Границы, сохраненные для этого файла каталога и этого набора признаков; иначе None
+    state = load_state(state_path_for(catalog_csv))
+    scaler = state.get('scaler') if state else None
+    if not scaler or scaler['catalog'] != os.path.basename(catalog_csv) or scaler['features'] != list(features):
+        return None
+    return scaler
+
+
+def _scaler_range(scaler):
+    data_min = np.asarray(scaler['min'], dtype=np.float64)
+    data_range = np.asarray(scaler['max'], dtype=np.float64) - data_min
+    # Постоянный признак, как и в MinMaxScaler, только сдвигается
+    return data_min, np.where(data_range == 0, 1, data_range)
+
+
+def minmax_transform(values, scaler):
+    data_min, data_range = _scaler_range(scaler)
+    return (np.asarray(values, dtype=np.float64) - data_min) / data_range
+
+
+def range_drift(values, scaler):
+    """Наибольший выход значений за сохраненный диапазон, в долях диапазона (0 - все внутри)"""
+    values = np.asarray(values, dtype=np.float64)
+    if not values.size:
+        return 0.0
+    data_min, data_range = _scaler_range(scaler)
+    data_max = np.asarray(scaler['max'], dtype=np.float64)
+    outside = np.maximum(data_min - values, values - data_max).clip(min=0) / data_range
+    return float(np.nan_to_num(outside).max())
+
+
+def build_catalog_state(vocabularies, filled_df, catalog_csv='data/laptops_with_avg_rating.csv'):
+    """Состояние по результату data.py: словари кодов и заполненный датасет (filled_laptops.csv)"""
+    from recomendation_system import CONTENT_FEATURES
+
+    return {
+        'encodings': vocabularies,
+        # После заполнения пропусков мода столбца не меняется
+        'fill_values': {col: float(filled_df[col].mode()[0]) for col in FILL_COLUMNS},
+        'scaler': fit_scaler_state(filled_df, CONTENT_FEATURES, catalog_csv),
+        'next_id': int(filled_df['id_laptop'].max()) + 1,
+    }
+
+
+def bootstrap_catalog_state(specs_csv='data/cleaned_warranty_laptops.csv',
+                            catalog_csv='data/laptops_with_avg_rating.csv'):
+    """
+    Состояние для уже построенного каталога без повторного запуска data.py: словари кодов
+    восстанавливаются по исходным строкам так же, как их строил LabelEncoder.
+    """
+    specs = pd.read_csv(specs_csv)
+    catalog = pd.read_csv(catalog_csv)
+
+    vocabularies = {}
+    for col in CATEGORICAL_COLUMNS:
+        # process_processor_column возвращает None, и label_encode_columns кодировал его строкой 'None'
+        values = specs[col].fillna('None').astype(str)
+        vocabulary = sorted(values.unique())
+        codes = values.map({value: code for code, value in enumerate(vocabulary)})
+        if not np.array_equal(codes.values, catalog[col].values):
+            raise ValueError(f"Коды столбца '{col}' в {catalog_csv} не совпадают с {specs_csv}")
+        vocabularies[col] = vocabulary
+
+    state = build_catalog_state(vocabularies, catalog, catalog_csv)
+    save_state(state, state_path_for(catalog_csv))
+    return state
+
+
+def _append_csv(df, path):
+    # Дописывание строк в конец файла в порядке его столбцов
+    columns = pd.read_csv(path, nrows=0).columns
+    df.reindex(columns=columns).to_csv(path, mode='a', header=False, index=False)
+
+
+def append_laptops(raw_df, catalog_csv='data/laptops_with_avg_rating.csv', filled_csv='data/filled_laptops.csv',
+                   specs_csv='data/cleaned_warranty_laptops.csv', drift_threshold=DRIFT_THRESHOLD):
+    """
+    Добавление новых ноутбуков (строки в формате data/laptops.csv) без пересборки каталога.
+    Строки разбираются функциями data.py, кодируются и нормализуются по сохраненному состоянию,
+    дописываются в конец файлов каталога и в кэш recomendation_system. Если признаки новых
+    ноутбуков выходят за сохраненный диапазон больше чем на drift_threshold, границы нормализации
+    пересчитываются по всему каталогу.
+    """
+    import data
+    import recomendation_system
+
+    state_path = state_path_for(catalog_csv)
+    state = load_state(state_path)
+    if state is None:
+        raise FileNotFoundError(f"Нет состояния каталога {state_path}, сначала запустите catalog_state.py")
+
+    with span('catalog_append.parse'):
+        df = data.drop_columns(raw_df.copy(), ['Unnamed: 0', 'discount'])
+        new_ids = pd.factorize(df['title'])[0]
+        df['id_laptop'] = state['next_id'] + new_ids
+        state['next_id'] += int(new_ids.max()) + 1 if len(new_ids) else 0
+        df = data.clean_price_column(df, price_col='price')
+        df = data.remove_duplicates(df)
+        df = data.process_ssd_column(df, ssd_col='SSD')
+        df = data.process_ram_column(df, ram_col='RAM')
+        df = data.process_processor_column(df, proc_col='Processor')
+        df = data.process_os_column(df, os_col='OS')
+        df = data.process_display_column(df, display_col='Display')
+        df = data.process_warranty_column(df, warranty_col='warranty')
+    specs = df.copy()
+
+    with span('catalog_append.encode'):
+        df = data.encode_with_vocabulary(df, {col: state['encodings'][col] for col in CATEGORICAL_COLUMNS})
+        for col in FILL_COLUMNS:
+            df = data.fillna_with_mode(df, col, mode_value=state['fill_values'][col])
+
+    scaler = state['scaler']
+    complete = df[scaler['features']].notna().all(axis=1)
+    if not complete.all():
+        print(f"Пропущено строк с неполными признаками: {(~complete).sum()}")
+        df, specs = df[complete], specs[complete]
+    laptops = df.assign(average_rating=np.nan).reset_index(drop=True)
+
+    drift = range_drift(laptops[scaler['features']], scaler)
+    rebuild = drift > drift_threshold
+
+    # Состояние сохраняется первым: если запись файлов прервется, останутся только
+    # неиспользованные коды и id, а не строки, закодированные несохраненными словарями
+    save_state(state, state_path)
+    with span('catalog_append.write'):
+        _append_csv(specs, specs_csv)
+        _append_csv(df, filled_csv)
+        _append_csv(laptops, catalog_csv)
+
+    if rebuild:
+        # Признаки ушли за диапазон: границы пересчитываются по всему каталогу,
+        # кэш каталога перестроится при следующем обращении (изменилось время файла)
+        with span('catalog_append.rebuild'):
+            state['scaler'] = fit_scaler_state(pd.read_csv(catalog_csv), scaler['features'], catalog_csv)
+            save_state(state, state_path)
+        print(f"Выход за диапазон признаков {drift:.2f} > {drift_threshold}: нормализация пересчитана")
+    else:
+        with span('catalog_append.cache'):
+            recomendation_system._append_catalog_rows(catalog_csv, laptops)
+
+    print(f"Добавлено ноутбуков: {len(laptops)}, id: {sorted(set(laptops['id_laptop']))}")
+    return {'ids': laptops['id_laptop'].tolist(), 'drift': drift, 'rebuilt': rebuild}
+
+
+if __name__ == "__main__":
+    bootstrap_catalog_state('data/cleaned_warranty_laptops.csv', 'data/laptops_with_avg_rating.csv')
@@ -1,22 +1,21 @@
 import numpy as np
 import pandas as pd
-import seaborn as sns
 import math
-import matplotlib.pyplot as plt
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error
 import re
 from sklearn.preprocessing import LabelEncoder
+from instrumentation import timed
 
 
 data_path= "data/laptops.csv"
 
+@timed('data.load_dataset')
 def load_dataset(filepath):
     """Загрузка датасета из CSV и начальный обзор"""
     df = pd.read_csv(filepath)
     print(f"Датасет загружен, размер: {df.shape}")
     return df
 
+@timed('data.drop_columns')
 def drop_columns(df, columns_to_drop, save_path=None):
     existing_cols = [col for col in columns_to_drop if col in df.columns]
     df_new = df.drop(columns=existing_cols)
@@ -31,6 +30,7 @@ def drop_columns(df, columns_to_drop, save_path=None):
     return df_new
 
 
+@timed('data.add_id_laptop_and_save')
 def add_id_laptop_and_save(df, save_path=None):
     df['id_laptop'] = pd.factorize(df['title'])[0]
     print("Столбец 'id_laptop' добавлен.")
@@ -39,6 +39,7 @@ def add_id_laptop_and_save(df, save_path=None):
         print(f"Обновлённый датасет сохранён в файл: {save_path}")
     return df
 
+@timed('data.clean_price_column')
 def clean_price_column(df, price_col='price', save_path=None):
     def clean_price(price_str):
         if isinstance(price_str, str):
@@ -56,6 +57,7 @@ def clean_price_column(df, price_col='price', save_path=None):
     return df
 
 
+@timed('data.remove_duplicates')
 def remove_duplicates(df, save_path=None):
     duplicates_count = df.duplicated().sum()
     print(f"Количество дубликатов до удаления: {duplicates_count}")
@@ -70,6 +72,7 @@ def remove_duplicates(df, save_path=None):
     return df_cleaned
 
 
+@timed('data.process_ssd_column')
 def process_ssd_column(df, ssd_col='SSD', save_path=None):
     def extract_ssd_size(ssd_val):
         if pd.isna(ssd_val):
@@ -96,6 +99,7 @@ def process_ssd_column(df, ssd_col='SSD', save_path=None):
         print(f"Обновлённый датасет сохранён в файл: {save_path}")
     return df
 
+@timed('data.process_ram_column')
 def process_ram_column(df, ram_col='RAM', save_path=None):
     def extract_ram_info(ram_val):
         if pd.isna(ram_val):
@@ -127,6 +131,7 @@ def process_ram_column(df, ram_col='RAM', save_path=None):
     return df
 
 
+@timed('data.process_processor_column')
 def process_processor_column(df, proc_col='Processor', save_path=None):
     def extract_processor_info(proc_str):
         if pd.isna(proc_str):
@@ -165,6 +170,7 @@ def process_processor_column(df, proc_col='Processor', save_path=None):
 
     return df
 
+@timed('data.process_os_column')
 def process_os_column(df, os_col='OS', save_path=None):
     def extract_os_info(os_str):
         if pd.isna(os_str):
@@ -203,6 +209,7 @@ def process_os_column(df, os_col='OS', save_path=None):
     return df
 
 
+@timed('data.process_display_column')
 def process_display_column(df, display_col='Display', save_path=None):
     def extract_display_size(display_str):
         if pd.isna(display_str):
@@ -232,6 +239,7 @@ def process_display_column(df, display_col='Display', save_path=None):
     return df
 
 
+@timed('data.process_warranty_column')
 def process_warranty_column(df, warranty_col='warranty', save_path=None):
     def extract_warranty_info(warranty_str):
         if pd.isna(warranty_str) or warranty_str.strip() == '':
@@ -268,6 +276,7 @@ def process_warranty_column(df, warranty_col='warranty', save_path=None):
 
     return df
 
+@timed('data.label_encode_columns')
 def label_encode_columns(df, categorical_cols, save_path=None):
     label_encoders = {}
     for col in categorical_cols:
@@ -282,8 +291,33 @@ def label_encode_columns(df, categorical_cols, save_path=None):
     return df, label_encoders
 
 
-def fillna_with_mode(df, column, save_path=None):
-    mode_value = df[column].mode()[0]
+@timed('data.encode_with_vocabulary')
+def encode_with_vocabulary(df, vocabularies, save_path=None):
+    """
+    Кодирование по сохраненным словарям {столбец: [значения]}: код значения - его позиция
+    в словаре. Новые значения дописываются в конец словаря, уже выданные коды не меняются.
+    """
+    for col, vocabulary in vocabularies.items():
+        codes = {value: code for code, value in enumerate(vocabulary)}
+        df[col] = df[col].astype(str)
+        for value in df[col].unique():
+            if value not in codes:
+                codes[value] = len(vocabulary)
+                vocabulary.append(value)
+                print(f"Новое значение '{value}' в столбце '{col}' получило код {codes[value]}")
+        df[col] = df[col].map(codes)
+    print(f"Проведено кодирование столбцов по сохраненным словарям: {list(vocabularies)}")
+    if save_path:
+        df.to_csv(save_path, index=False)
+        print(f"Обновлённый датасет сохранён в файл: {save_path}")
+    return df
+
+
+@timed('data.fillna_with_mode')
+def fillna_with_mode(df, column, save_path=None, mode_value=None):
+    # mode_value - сохраненная мода всего каталога, чтобы не пересчитывать ее по новым строкам
+    if mode_value is None:
+        mode_value = df[column].mode()[0]
     df[column] = df[column].fillna(mode_value)
     print(f"Пропуски в колонке '{column}' заполнены значением моды: {mode_value}")
 
@@ -311,6 +345,11 @@ if __name__ == "__main__":
     df, encoders = label_encode_columns(df, categorical_cols, save_path='data/encoded_laptops.csv')
     df = fillna_with_mode(df, 'Proc_Cores', save_path='data/filled_laptops.csv')
 
+    # Словари кодов, мода и границы нормализации для дозагрузки ноутбуков (catalog_state.py)
+    from catalog_state import build_catalog_state, save_state, state_path_for
+    vocabularies = {col: [str(value) for value in le.classes_] for col, le in encoders.items()}
+    save_state(build_catalog_state(vocabularies, df), state_path_for('data/laptops_with_avg_rating.csv'))
+
    # Датасет для расчетов filled_laptops.csv
    # Для вывода информации о продукте cleaned_warranty_laptops.csv
 
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import KFold
+from sklearn.metrics import mean_squared_error
+
+
+# Настройка параметров оценки качества
+class EvaluationConfig:
+    def __init__(self, n_folds=5, k=5, relevance_threshold=4, max_users_per_fold=200, max_workers=None,
+                 seed=42):
+        self.n_folds = n_folds
+        self.k = k
+        self.relevance_threshold = relevance_threshold  # оценка, начиная с которой ноутбук считается релевантным
+        self.max_users_per_fold = max_users_per_fold
+        self.max_workers = max_workers
+        self.seed = seed
+
+
+# Каждый движок: train(train_csv, laptops_csv) -> recommend(user_id, top_n) -> DataFrame
+# в формате recommend_laptops_for_user (id_laptop, title, predicted_rating)
+def _train_user_based(train_csv, laptops_csv):
+    from recomendation_system import recommend_laptops_for_user
+    return lambda user_id, top_n: recommend_laptops_for_user(user_id, laptops_csv, train_csv, top_n=top_n)
+
+
+def _train_item_based(train_csv, laptops_csv):
+    from recomendation_system import recommend_laptops_for_user, _get_item_similarity
+    _get_item_similarity(train_csv)  # предрасчет схожести входит во время обучения
+    return lambda user_id, top_n: recommend_laptops_for_user(user_id, laptops_csv, train_csv, top_n=top_n,
+                                                             mode='item')
+
+
+def _train_matrix_factorization(train_csv, laptops_csv):
+    from matrix_factorization import train_als, recommend_laptops_for_user_mf
+    model = train_als(pd.read_csv(train_csv))
+    return lambda user_id, top_n: recommend_laptops_for_user_mf(user_id, laptops_csv, train_csv, model, top_n=top_n)
+
+
+ENGINES = {
+    'user-user': _train_user_based,
+    'item-item': _train_item_based,
+    'matrix factorization': _train_matrix_factorization,
+}
+
+
+def make_folds(ratings_df, n_folds=5, seed=42):
+    """Разбиение оценок на фолды (train, test)"""
+    kfold = KFold(n_splits=n_folds, shuffle=True, random_state=seed)
+    return [(ratings_df.iloc[train_idx], ratings_df.iloc[test_idx])
+            for train_idx, test_idx in kfold.split(ratings_df)]
+
+
+def evaluate_fold(engine_name, laptops_csv, train_df, test_df, config, fold=0):
+    """
+    Оценка одного движка на одном фолде, выполняется в отдельном процессе. Прогнозы по отложенным
+    парам возвращаются в predictions: RMSE считает evaluate_engines по парам, общим для всех движков
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        train_csv = os.path.join(tmp_dir, 'train_ratings.csv')
+        train_df.to_csv(train_csv, index=False)
+
+        start = time.perf_counter()
+        recommend = ENGINES[engine_name](train_csv, laptops_csv)
+        train_time = time.perf_counter() - start
+
+        catalog_size = pd.read_csv(laptops_csv)['id_laptop'].nunique()
+        test_users = test_df['id_user'].drop_duplicates()
+        test_users = test_users[test_users.isin(train_df['id_user'])]
+        test_users = test_users.sample(min(len(test_users), config.max_users_per_fold),
+                                       random_state=config.seed)
+
+        predictions = []  # [id_user, id_laptop, оценка, прогноз]
+        precisions, recalls, latencies = [], [], []
+        recommended_items = set()
+        for user in test_users:
+            actual = test_df[test_df['id_user'] == user].set_index('id_laptop')['user_rating']
+
+            # Задержка - обычного запроса top-k, полный список прогнозов нужен только для RMSE
+            start = time.perf_counter()
+            rec = recommend(user, config.k)
+            latencies.append(time.perf_counter() - start)
+            if rec.empty:
+                continue
+
+            predicted = recommend(user, catalog_size).drop_duplicates('id_laptop') \
+                .set_index('id_laptop')['predicted_rating']
+            common = actual.index.intersection(predicted.index)
+            predictions.extend([int(user), int(laptop), float(actual[laptop]), float(predicted[laptop])]
+                               for laptop in common)
+
+            top_k = rec['id_laptop'].drop_duplicates().values[:config.k]
+            recommended_items.update(top_k)
+            relevant = set(actual.index[actual >= config.relevance_threshold])
+            if relevant:
+                hits = len(relevant.intersection(top_k))
+                precisions.append(hits / config.k)
+                recalls.append(hits / len(relevant))
+
+    return {
+        'engine': engine_name,
+        'fold': fold,
+        'rmse': None,  # заполняет evaluate_engines по общим парам
+        'rmse_pairs': 0,
+        'engine_pairs': len(predictions),  # пары с прогнозом этого движка, справочно
+        f'precision@{config.k}': float(np.mean(precisions)) if precisions else 0.0,
+        f'recall@{config.k}': float(np.mean(recalls)) if recalls else 0.0,
+        'coverage': len(recommended_items) / catalog_size,
+        'train_time_s': train_time,
+        'latency_ms': float(np.mean(latencies)) * 1000 if latencies else None,
+        'users': len(test_users),
+        'predictions': predictions,
+    }
+
+
+def _common_pair_rmse(fold_results):
+    # RMSE движков одного фолда по отложенным парам, для которых прогноз есть у всех движков
+    by_engine = {r['engine']: {(u, l): (actual, pred) for u, l, actual, pred in r.pop('predictions')}
+                 for r in fold_results}
+    common = set.intersection(*(set(pairs) for pairs in by_engine.values()))
+    for r in fold_results:
+        pairs = by_engine[r['engine']]
+        r['rmse_pairs'] = len(common)
+        if common:
+            y_true, y_pred = zip(*(pairs[pair] for pair in common))
+            r['rmse'] = float(np.sqrt(mean_squared_error(y_true, y_pred)))
+
+
+def _mean_or_none(values):
+    values = [v for v in values if v is not None]
+    return float(np.mean(values)) if values else None
+
+
+def evaluate_engines(laptops_csv, ratings_csv, engines=None, config=None, report_path=None):
+    """Параллельная оценка движков по фолдам, результат - усредненные метрики и JSON-отчет"""
+    config = config or EvaluationConfig()
+    engines = engines or list(ENGINES)
+    ratings = pd.read_csv(ratings_csv)
+    folds = make_folds(ratings, config.n_folds, config.seed)
+
+    with ProcessPoolExecutor(max_workers=config.max_workers) as executor:
+        futures = [
+            executor.submit(evaluate_fold, engine, laptops_csv, train_df, test_df, config, fold)
+            for engine in engines
+            for fold, (train_df, test_df) in enumerate(folds)
+        ]
+        fold_results = [future.result() for future in futures]
+
+    # Все движки фолда оцениваются на одних и тех же пользователях (одинаковая выборка по seed)
+    for fold in range(len(folds)):
+        _common_pair_rmse([r for r in fold_results if r['fold'] == fold])
+
+    summary = []
+    for engine in engines:
+        results = [r for r in fold_results if r['engine'] == engine]
+        row = {'engine': engine}
+        for key in results[0]:
+            if key not in ('engine', 'fold'):
+                row[key] = _mean_or_none([r[key] for r in results])
+        summary.append(row)
+
+    report = {
+        'config': vars(config),
+        'summary': summary,
+        'folds': fold_results,
+    }
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Отчет об оценке сохранен в файл: {report_path}")
+
+    print(pd.DataFrame(summary))
+    return report
+
+
+if __name__ == "__main__":
+    evaluate_engines('data/laptops_with_avg_rating.csv', 'data/generated_ratings.csv',
+                     config=EvaluationConfig(n_folds=5, k=5), report_path='data/evaluation_report.json')
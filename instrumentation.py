@@ -0,0 +1,172 @@
+import os
+import time
+import json
+import atexit
+import cProfile
+import pstats
+import threading
+from functools import wraps
+
+# Включение через переменные окружения:
+# RECSYS_METRICS=1 - сбор таймингов и счетчиков
+# RECSYS_METRICS_PATH - файл для выгрузки при завершении (.prom - формат Prometheus, .jsonl - JSON lines)
+# RECSYS_PROFILE_PATH - профилировать через cProfile первый запрос и сохранить профиль в этот файл
+ENABLED = os.environ.get('RECSYS_METRICS', '') == '1'
+EXPORT_PATH = os.environ.get('RECSYS_METRICS_PATH', 'metrics.prom')
+_profile_next = os.environ.get('RECSYS_PROFILE_PATH') or None
+
+_lock = threading.Lock()
+_spans = {}  # имя -> [количество, суммарное время, максимальное время]
+_counters = {}
+
+
+def enable(flag=True):
+    global ENABLED
+    ENABLED = flag
+
+
+def profile_next(save_path='request.prof'):
+    """Включить профилирование следующего вызова функции, помеченной @timed"""
+    global _profile_next
+    _profile_next = save_path
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            stats = _spans.get(self.name)
+            if stats is None:
+                _spans[self.name] = [1, elapsed, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+        return False
+
+
+def span(name):
+    """Замер времени блока: with span('stage'): ... При выключенных метриках - общий пустой объект"""
+    return _Span(name) if ENABLED else _NOOP_SPAN
+
+
+def count(name, value=1):
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def timed(name):
+    """Декоратор, замеряющий время вызова функции"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            global _profile_next
+            if _profile_next is not None:
+                save_path, _profile_next = _profile_next, None
+                return profile_request(func, *args, save_path=save_path, **kwargs)
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    with _lock:
+        spans = {name: {'count': s[0], 'total_s': s[1], 'max_s': s[2]} for name, s in _spans.items()}
+        counters = dict(_counters)
+    return {'spans': spans, 'counters': counters}
+
+
+def _metric_label(name):
+    return name.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def export_prometheus(path):
+    data = snapshot()
+    lines = [
+        '# TYPE recsys_span_seconds_total counter',
+        '# TYPE recsys_span_count counter',
+        '# TYPE recsys_span_seconds_max gauge',
+    ]
+    for name, stats in sorted(data['spans'].items()):
+        label = f'{{span="{_metric_label(name)}"}}'
+        lines.append(f'recsys_span_seconds_total{label} {stats["total_s"]:.9f}')
+        lines.append(f'recsys_span_count{label} {stats["count"]}')
+        lines.append(f'recsys_span_seconds_max{label} {stats["max_s"]:.9f}')
+    lines.append('# TYPE recsys_counter_total counter')
+    for name, value in sorted(data['counters'].items()):
+        lines.append(f'recsys_counter_total{{name="{_metric_label(name)}"}} {value}')
+
+    # Пишем во временный файл и подменяем, чтобы сборщик не прочитал файл наполовину
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
+
+
+def export_jsonl(path):
+    data = snapshot()
+    timestamp = time.time()
+    with open(path, 'a', encoding='utf-8') as f:
+        for name, stats in sorted(data['spans'].items()):
+            f.write(json.dumps({'ts': timestamp, 'type': 'span', 'name': name, **stats}, ensure_ascii=False) + '\n')
+        for name, value in sorted(data['counters'].items()):
+            f.write(json.dumps({'ts': timestamp, 'type': 'counter', 'name': name, 'value': value},
+                               ensure_ascii=False) + '\n')
+
+
+def export(path=None):
+    path = path or EXPORT_PATH
+    if path.endswith('.jsonl'):
+        export_jsonl(path)
+    else:
+        export_prometheus(path)
+    print(f"Метрики сохранены в файл: {path}")
+
+
+def profile_request(func, *args, save_path=None, top=20, **kwargs):
+    """Профилирование одного вызова через cProfile, печатает самые затратные функции"""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    stats = pstats.Stats(profiler).sort_stats('cumulative')
+    stats.print_stats(top)
+    if save_path:
+        stats.dump_stats(save_path)
+        print(f"Профиль сохранен в файл: {save_path}")
+    return result
+
+
+@atexit.register
+def _export_at_exit():
+    if ENABLED and (_spans or _counters):
+        export()
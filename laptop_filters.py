@@ -0,0 +1,138 @@
+import heapq
+import numpy as np
+
+# Числовые характеристики фильтруются по диапазону, категориальные - по множеству значений
+RANGE_COLUMNS = ['price', 'RAM_GB', 'SSD', 'Display_inch']
+CATEGORY_COLUMNS = ['OS_Name']
+
+
+class AttributeIndex:
+    """Предрасчитанные индексы по характеристикам ноутбуков для фильтрации кандидатов"""
+
+    def __init__(self, laptops_df):
+        self.size = len(laptops_df)
+
+        # Для числовых столбцов храним порядок сортировки и отсортированные значения,
+        # тогда диапазон находится двумя бинарными поисками
+        self.sorted_order = {}
+        self.sorted_values = {}
+        for col in RANGE_COLUMNS:
+            if col not in laptops_df.columns:
+                continue
+            values = laptops_df[col].values.astype(np.float64)
+            order = np.argsort(values, kind='stable')
+            self.sorted_order[col] = order
+            self.sorted_values[col] = values[order]
+
+        # Для категориальных столбцов храним битовую маску на каждое значение
+        self.bitmaps = {}
+        for col in CATEGORY_COLUMNS:
+            if col not in laptops_df.columns:
+                continue
+            values = laptops_df[col].values
+            self.bitmaps[col] = {value: values == value for value in np.unique(values)}
+
+    def extended(self, new_df):
+        """
+        Новый индекс с добавленными в конец строками new_df: позиции новых строк вставляются
+        в отсортированные массивы бинарным поиском, без повторной сортировки всего каталога.
+        """
+        index = AttributeIndex.__new__(AttributeIndex)
+        index.size = self.size + len(new_df)
+        new_positions = np.arange(self.size, index.size)
+
+        index.sorted_order = {}
+        index.sorted_values = {}
+        for col, sorted_values in self.sorted_values.items():
+            values = new_df[col].values.astype(np.float64)
+            order = np.argsort(values, kind='stable')
+            # side='right': новые строки идут после старых с тем же значением, как при stable-сортировке
+            insert_at = np.searchsorted(sorted_values, values[order], side='right')
+            index.sorted_values[col] = np.insert(sorted_values, insert_at, values[order])
+            index.sorted_order[col] = np.insert(self.sorted_order[col], insert_at, new_positions[order])
+
+        index.bitmaps = {}
+        for col, bitmaps in self.bitmaps.items():
+            values = new_df[col].values
+            index.bitmaps[col] = {value: np.concatenate([bitmaps.get(value, np.zeros(self.size, dtype=bool)),
+                                                         values == value])
+                                  for value in set(bitmaps) | set(np.unique(values))}
+        return index
+
+    def to_arrays(self):
+        # Индекс в виде именованных массивов, битовые маски столбца - одна матрица значение x строка
+        arrays = {}
+        for col in self.sorted_order:
+            arrays[f'sorted_order.{col}'] = self.sorted_order[col]
+            arrays[f'sorted_values.{col}'] = self.sorted_values[col]
+        for col, bitmaps in self.bitmaps.items():
+            values = sorted(bitmaps)
+            arrays[f'bitmap_values.{col}'] = np.array(values)
+            arrays[f'bitmaps.{col}'] = np.array([bitmaps[value] for value in values]).reshape(len(values), self.size)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, size, arrays):
+        """Индекс поверх готовых массивов (например, отображенных в память) без копирования"""
+        index = cls.__new__(cls)
+        index.size = size
+        index.sorted_order, index.sorted_values, index.bitmaps = {}, {}, {}
+        for name, array in arrays.items():
+            kind, col = name.split('.', 1)
+            if kind == 'sorted_order':
+                index.sorted_order[col] = array
+            elif kind == 'sorted_values':
+                index.sorted_values[col] = array
+            elif kind == 'bitmaps':
+                values = arrays[f'bitmap_values.{col}']
+                index.bitmaps[col] = {value.item(): array[i] for i, value in enumerate(values)}
+        return index
+
+    def range_positions(self, col, low=None, high=None):
+        # Позиции строк со значением в [low, high]; пропуски (NaN) стоят в конце и не попадают в диапазон
+        sorted_values = self.sorted_values[col]
+        start = 0 if low is None else np.searchsorted(sorted_values, low, side='left')
+        end = np.searchsorted(sorted_values, np.inf if high is None else high, side='right')
+        return self.sorted_order[col][start:end]
+
+    def candidate_mask(self, filters):
+        """
+        filters - словарь вида {'price': (None, 50000), 'RAM_GB': (16, None), 'OS_Name': [3]}.
+        Категории задаются кодами каталога; названия переводит в коды recomendation_system.
+        Возвращает булеву маску строк, удовлетворяющих всем условиям.
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for col, condition in (filters or {}).items():
+            if col in self.sorted_order:
+                if not isinstance(condition, (list, tuple)) or len(condition) != 2:
+                    raise ValueError(f"Условие для столбца '{col}' - пара (min, max), None - без ограничения, "
+                                     f"получено: {condition!r}")
+                low, high = condition
+                col_mask = np.zeros(self.size, dtype=bool)
+                col_mask[self.range_positions(col, low, high)] = True
+            elif col in self.bitmaps:
+                values = condition if isinstance(condition, (list, tuple, set)) else [condition]
+                col_mask = np.zeros(self.size, dtype=bool)
+                for value in values:
+                    if isinstance(value, str):
+                        raise ValueError(f"Неизвестное значение '{value}' для столбца '{col}'")
+                    if value in self.bitmaps[col]:
+                        col_mask |= self.bitmaps[col][value]
+            else:
+                raise ValueError(f"Фильтрация по столбцу '{col}' не поддерживается")
+            mask &= col_mask
+        return mask
+
+
+def top_n_positions(scores, top_n):
+    # Частичный отбор top_n вместо полной сортировки, результат упорядочен по убыванию
+    top_n = min(top_n, len(scores))
+    if top_n <= 0:
+        return np.array([], dtype=np.int64)
+    top = np.argpartition(-scores, top_n - 1)[:top_n]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def top_n_items(scores, top_n):
+    # То же для словаря {id_laptop: score}
+    return heapq.nlargest(top_n, scores.items(), key=lambda x: x[1])
@@ -1,11 +1,10 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import pandas as pd
-from recomendation_system import (
-    get_top_laptops_by_tmdb_rating,
-    recommend_similar_laptops,
-    recommend_laptops_for_user
-)
+from instrumentation import span, count, timed
+from warmup import Warmup
+
+# pandas и recomendation_system импортируются внутри методов: к моменту их вызова
+# модули уже загружены фоновым прогревом, а окно входа не ждет их импорта
 
 class App:
     def __init__(self, root):
@@ -13,17 +12,13 @@ class App:
         self.root.title("Приложение ноутбуков")
         self.root.geometry("700x500")  # фиксированный размер окна
 
-        # Загрузка CSV с ноутбуками и рейтингами
-        try:
-            self.ratings_df = pd.read_csv('data/generated_ratings.csv')
-            self.laptops_df = pd.read_csv('data/laptops_with_avg_rating.csv')
-            self.laptops_specs_df = pd.read_csv('data/cleaned_warranty_laptops.csv')
-
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка загрузки данных:\n{e}")
-            root.destroy()
-            return
-        self.filtered_sorted_df = self.laptops_df.copy()
+        # Загрузка CSV с ноутбуками и рейтингами идет в фоне, пока пользователь вводит id
+        self.warmup = Warmup().start()
+        self.data_loaded = False
+        self.pending_login = False
+        self.rating_store = None
+        self.login_id = None
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # Фрейм входа
         self.frame_login = tk.Frame(root)
@@ -41,6 +36,9 @@ class App:
         self.id_user_entry.bind('<Return>', self.login)
         tk.Button(center_frame, text="Войти", command=self.login).pack(pady=10)
 
+        self.status_label = tk.Label(center_frame, text="", fg='gray')
+        self.status_label.pack()
+
         # Фрейм основного приложения (по умолчанию скрыт)
         self.frame_main = tk.Frame(root)
 
@@ -128,20 +126,62 @@ class App:
                 self.tree.insert('', 'end', values=(short_title, price, avg_rating_str))
 
 
-        for _, row in self.laptops_df.iterrows():
-            title = row['title']
-            short_title = (title[:25] + '...') if len(title) > 25 else title
-            price = row['price']
-            avg_rating = row.get('average_rating', None)
-            avg_rating_str = f"{avg_rating:.2f}" if avg_rating is not None and not pd.isna(avg_rating) else "0"
-
-            self.tree.insert('', tk.END, values=(short_title, price, avg_rating_str))
-
         self.tree.bind('<Double-1>', self.show_details_treeview)
 
         self.id_user = None  # будет установлен после входа
+        self.cf_mode = tk.StringVar(value='user')  # режим коллаборативной фильтрации
+        self.segment_var = tk.StringVar()  # сегмент топа для нового пользователя
+
+        self.root.after(50, self.check_warmup)
+
+    def check_warmup(self):
+        # Опрос фонового прогрева из главного потока: Tk нельзя трогать из других потоков
+        if not self.warmup.ready.is_set():
+            self.root.after(50, self.check_warmup)
+            return
+
+        if self.warmup.error is not None:
+            messagebox.showerror("Ошибка", f"Ошибка загрузки данных:\n{self.warmup.error}")
+            self.root.destroy()
+            return
 
+        from rating_store import RatingStore
+        from recomendation_system import attach_rating_store
+
+        # Хранилище оценок дописывает новые оценки в журнал и в фоне переносит их в CSV;
+        # рекомендации читают оценки через него и видят новые оценки сразу
+        self.rating_store = RatingStore(base_df=self.warmup.data['ratings_df']).start_background_compaction()
+        attach_rating_store(self.rating_store)
+        self.ratings_df = self.rating_store.ratings_df()
+        self.laptops_df = self.warmup.data['laptops_df']
+        self.laptops_specs_df = self.warmup.data['laptops_specs_df']
+        self.leaderboards = self.warmup.data['leaderboards']
+        self.filtered_sorted_df = self.laptops_df.copy()
+        self.fill_all_laptops_tree()
+        self.data_loaded = True
+        self.status_label.config(text="")
+
+        if self.pending_login:
+            self.pending_login = False
+            self.login()
+
+    def fill_all_laptops_tree(self):
+        import pandas as pd
+
+        with span('gui.treeview_fill'):
+            for _, row in self.laptops_df.iterrows():
+                title = row['title']
+                short_title = (title[:25] + '...') if len(title) > 25 else title
+                price = row['price']
+                avg_rating = row.get('average_rating', None)
+                avg_rating_str = f"{avg_rating:.2f}" if avg_rating is not None and not pd.isna(avg_rating) else "0"
+
+                self.tree.insert('', tk.END, values=(short_title, price, avg_rating_str))
+
+    @timed('gui.new_user_tab')
     def create_new_user_info_tab(self):
+        from recomendation_system import get_top_laptops_by_tmdb_rating
+
         frame = self.tab_user
         for widget in frame.winfo_children():
             widget.destroy()
@@ -150,7 +190,22 @@ class App:
 
         tk.Label(frame, text="Рекомендуемые топ ноутбуки:", font=('Arial', 14, 'bold'), padx=10, pady=15).pack(anchor='w')
 
-        top_10_df = get_top_laptops_by_tmdb_rating('data/laptops_with_avg_rating.csv', 'data/generated_ratings.csv')
+        if self.leaderboards:
+            from popularity import get_segment_top, segment_label
+
+            # Предрасчитанные топы по сегментам, без обращения к оценкам
+            options = {segment_label(segment, value): (segment, value) for segment, value in self.leaderboards}
+            if self.segment_var.get() not in options:
+                self.segment_var.set(segment_label('global', 'all'))
+            segment_box = ttk.Combobox(frame, textvariable=self.segment_var, values=sorted(options),
+                                       state='readonly', width=30)
+            segment_box.pack(anchor='w', padx=10)
+            segment_box.bind('<<ComboboxSelected>>', lambda event: self.create_new_user_info_tab())
+
+            top_10_df = get_segment_top(self.leaderboards, *options[self.segment_var.get()], top_n=5)
+        else:
+            top_10_df = get_top_laptops_by_tmdb_rating('data/laptops_with_avg_rating.csv',
+                                                       'data/generated_ratings.csv')
 
         if top_10_df.empty:
             tk.Label(frame, text="Нет доступных рекомендаций.", padx=10, pady=10).pack()
@@ -177,15 +232,23 @@ class App:
             title = row['title']
             short_title = (title[:25] + '...') if len(title) > 25 else title
 
-            price_row = self.laptops_df[self.laptops_df['title'] == row['title']]
-            price = price_row['price'].values[0] if not price_row.empty else "0"
+            if 'price' in row:
+                price = row['price']
+            else:
+                price_row = self.laptops_df[self.laptops_df['title'] == row['title']]
+                price = price_row['price'].values[0] if not price_row.empty else "0"
 
             weighted_rating = row.get('weighted_rating', 0.0)
             wr_str = f"{weighted_rating:.2f}"
 
             tree_rec.insert('', 'end', values=(short_title, price, wr_str))
 
+    @timed('gui.update_treeview')
     def update_treeview(self):
+        import pandas as pd
+
+        if not self.data_loaded:
+            return
         query = self.search_var.get().lower() if hasattr(self, 'search_var') else ""
 
         # Фильтрация по названию с учетом NaN
@@ -207,19 +270,21 @@ class App:
 
         self.filtered_sorted_df = filtered
 
-        # Очистить Treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        with span('gui.treeview_fill'):
+            # Очистить Treeview
+            for item in self.tree.get_children():
+                self.tree.delete(item)
 
-        # Заполнить Treeview новыми данными
-        for _, row in filtered.iterrows():
-            title = row['title']
-            short_title = (title[:25] + '...') if len(title) > 25 else title
-            price = row['price']
-            avg_rating = row.get('average_rating', None)
-            avg_rating_str = f"{avg_rating:.2f}" if avg_rating is not None and not pd.isna(avg_rating) else "0"
+            # Заполнить Treeview новыми данными
+            for _, row in filtered.iterrows():
+                title = row['title']
+                short_title = (title[:25] + '...') if len(title) > 25 else title
+                price = row['price']
+                avg_rating = row.get('average_rating', None)
+                avg_rating_str = f"{avg_rating:.2f}" if avg_rating is not None and not pd.isna(avg_rating) else "0"
 
-            self.tree.insert('', 'end', values=(short_title, price, avg_rating_str))
+                self.tree.insert('', 'end', values=(short_title, price, avg_rating_str))
+        count('gui.treeview_rows', len(filtered))
 
     def login(self, event=None):
         id_user = self.id_user_entry.get()
@@ -227,7 +292,14 @@ class App:
             messagebox.showerror("Ошибка", "Введите корректный ID пользователя.")
             return
 
+        # Если данные еще грузятся, вход продолжится автоматически после прогрева
+        if not self.data_loaded:
+            self.pending_login = True
+            self.status_label.config(text="Загрузка данных...")
+            return
+
         id_user_int = int(id_user)
+        self.login_id = id_user_int
         self.frame_login.pack_forget()
         self.frame_main.pack(fill='both', expand=True)
 
@@ -240,7 +312,31 @@ class App:
 
         self.notebook.select(self.tab_user)
 
+    def rate_laptop(self, laptop_id, rating):
+        try:
+            self.rating_store.ingest(self.login_id, laptop_id, rating)
+        except ValueError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+
+        # Оценка сразу видна в интерфейсе и рекомендациям, в CSV она попадет при компактации журнала
+        self.ratings_df = self.rating_store.ratings_df()
+        self.laptops_df.loc[self.laptops_df['id_laptop'] == laptop_id, 'average_rating'] = \
+            self.rating_store.average_rating(laptop_id)
+        self.id_user = self.login_id
+        self.create_user_info_tab()
+        messagebox.showinfo("Готово", "Оценка сохранена.")
+
+    def on_close(self):
+        if self.rating_store is not None:
+            self.rating_store.close()
+        self.root.destroy()
+
+    @timed('gui.details_window')
     def show_details_treeview(self, event):
+        import pandas as pd
+        from recomendation_system import recommend_similar_laptops
+
         selected_item = self.tree.focus()
         if not selected_item:
             messagebox.showinfo("Внимание", "Пожалуйста, выберите ноутбук из списка.")
@@ -289,6 +385,16 @@ class App:
 
         tk.Label(details_window, text=info, justify=tk.LEFT, padx=10, pady=10).pack()
 
+        # Форма оценки ноутбука
+        rate_frame = tk.Frame(details_window)
+        rate_frame.pack(pady=5)
+        tk.Label(rate_frame, text="Ваша оценка:").pack(side=tk.LEFT)
+        rating_var = tk.IntVar(value=5)
+        ttk.Spinbox(rate_frame, from_=0, to=5, width=5, textvariable=rating_var, state='readonly').pack(
+            side=tk.LEFT, padx=5)
+        tk.Button(rate_frame, text="Оценить",
+                  command=lambda: self.rate_laptop(row['id_laptop'], rating_var.get())).pack(side=tk.LEFT)
+
         similar_df = recommend_similar_laptops('data/laptops_with_avg_rating.csv', row['id_laptop'], top_n=5)
 
         if not similar_df.empty:
@@ -342,7 +448,11 @@ class App:
         else:
             tk.Label(details_window, text="Похожие ноутбуки не найдены.", padx=10, pady=10).pack()
 
+    @timed('gui.user_tab')
     def create_user_info_tab(self):
+        import pandas as pd
+        from recomendation_system import recommend_laptops_for_user
+
         frame = self.tab_user
         for widget in frame.winfo_children():
             widget.destroy()
@@ -384,8 +494,18 @@ class App:
         # Вывод таблицы рекомендаций
         tk.Label(frame, text="Рекомендации для вас:", font=('Arial', 14, 'bold'), padx=10, pady=15).pack(anchor='w')
 
+        mode_frame = tk.Frame(frame)
+        mode_frame.pack(anchor='w', padx=10)
+        for text, mode in [("По похожим пользователям", 'user'), ("По похожим ноутбукам", 'item'),
+                           ("Гибридный", 'hybrid')]:
+            ttk.Radiobutton(mode_frame, text=text, value=mode, variable=self.cf_mode,
+                            command=self.create_user_info_tab).pack(side=tk.LEFT, padx=5)
+
         recommended_df = recommend_laptops_for_user(self.id_user, 'data/laptops_with_avg_rating.csv',
-                                                    'data/generated_ratings.csv', top_n=5)
+                                                    'data/generated_ratings.csv', top_n=5,
+                                                    mode=self.cf_mode.get(),
+                                                    item_similarity_path='data/item_similarity.npz',
+                                                    neighbor_graph_path='data/user_neighbors.npz')
 
         if recommended_df.empty:
             tk.Label(frame, text="Невозможно построить рекомендации.", padx=10, pady=10).pack()
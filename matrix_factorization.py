@@ -0,0 +1,215 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from recomendation_system import (_cached, _get_catalog, _get_user_item, _full_numerator_denominator, _user_item_stats,
+                                  _format_user_recommendations)
+from laptop_filters import top_n_positions
+from neighbor_graph import user_item_matrix
+
+
+# Настройка параметров обучения латентной модели
+class MFConfig:
+    def __init__(self, rank=16, regularization=0.1, epochs=15, seed=42):
+        self.rank = rank
+        self.regularization = regularization
+        self.epochs = epochs
+        self.seed = seed
+
+
+def _als_step(fixed, index_ptr, neighbors, residuals, regularization):
+    # Решаем по одной ридж-регрессии на каждую строку: fixed[:, :-1] - признаки
+    # соседей, последний столбец fixed - смещение соседа, которое вычитается из целевой переменной
+    num_rows = len(index_ptr) - 1
+    dim = fixed.shape[1] - 1
+    solved = np.zeros((num_rows, dim), dtype=np.float64)
+    reg = regularization * np.eye(dim)
+    for row in range(num_rows):
+        start, end = index_ptr[row], index_ptr[row + 1]
+        if start == end:
+            continue
+        design = fixed[neighbors[start:end], :-1]
+        target = residuals[start:end] - fixed[neighbors[start:end], -1]
+        solved[row] = np.linalg.solve(design.T @ design + reg, design.T @ target)
+    return solved
+
+
+def _group_by(rows, cols, values, num_rows):
+    # CSR-подобная группировка наблюдений по строкам
+    order = np.argsort(rows, kind='stable')
+    index_ptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.add.at(index_ptr, rows + 1, 1)
+    return np.cumsum(index_ptr), cols[order], values[order]
+
+
+def train_als(ratings_df, config=None):
+    """Обучение матричной факторизации методом ALS на наблюдаемых оценках"""
+    config = config or MFConfig()
+    rng = np.random.default_rng(config.seed)
+
+    user_ids, user_idx = np.unique(ratings_df['id_user'].values, return_inverse=True)
+    item_ids, item_idx = np.unique(ratings_df['id_laptop'].values, return_inverse=True)
+    values = ratings_df['user_rating'].values.astype(np.float64)
+
+    global_mean = values.mean()
+    residuals = values - global_mean
+
+    # Векторы дополнены смещениями: пользователь [p_u, b_u, 1], ноутбук [q_i, 1, b_i],
+    # поэтому прогноз - это одно скалярное произведение плюс глобальное среднее
+    k = config.rank
+    users = np.zeros((len(user_ids), k + 2))
+    items = np.zeros((len(item_ids), k + 2))
+    users[:, :k] = rng.normal(scale=0.1, size=(len(user_ids), k))
+    items[:, :k] = rng.normal(scale=0.1, size=(len(item_ids), k))
+    users[:, k + 1] = 1.0
+    items[:, k] = 1.0
+
+    by_user = _group_by(user_idx, item_idx, residuals, len(user_ids))
+    by_item = _group_by(item_idx, user_idx, residuals, len(item_ids))
+
+    for _ in range(config.epochs):
+        # Для пользователей: признаки ноутбука [q_i, 1], смещение b_i
+        fixed = np.column_stack([items[:, :k + 1], items[:, k + 1]])
+        users[:, :k + 1] = _als_step(fixed, *by_user, config.regularization)
+        # Для ноутбуков: признаки пользователя [p_u, 1], смещение b_u
+        fixed = np.column_stack([users[:, :k], users[:, k + 1], users[:, k]])
+        solved = _als_step(fixed, *by_item, config.regularization)
+        items[:, :k] = solved[:, :k]
+        items[:, k + 1] = solved[:, k]
+
+    return {
+        'user_ids': user_ids,
+        'item_ids': item_ids,
+        'user_factors': users.astype(np.float32),
+        'item_factors': items.astype(np.float32),
+        'global_mean': np.float32(global_mean),
+    }
+
+
+def save_model(model, save_path):
+    np.savez(save_path, **model)
+    print(f"Модель факторизации сохранена в файл: {save_path}")
+
+
+def load_model(model_path):
+    with np.load(model_path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def train_and_save(ratings_csv, save_path, config=None):
+    ratings = pd.read_csv(ratings_csv)
+    model = train_als(ratings, config)
+    save_model(model, save_path)
+    return model
+
+
+def predict_ratings(model, user_idx, item_idx):
+    dots = np.einsum('ij,ij->i', model['user_factors'][user_idx], model['item_factors'][item_idx])
+    return dots + model['global_mean']
+
+
+def recommend_laptops_for_user_mf(user_id, laptops_csv, ratings_csv, model, top_n=5):
+    # model - словарь из train_als/load_model или путь к .npz (загружается один раз);
+    # ratings_csv - оценки, по которым исключаются уже оцененные ноутбуки, как в recommend_laptops_for_user
+    if isinstance(model, (str, os.PathLike)):
+        model = _cached('mf_model', model, lambda: load_model(model))
+    laptops = _get_catalog(laptops_csv)['df']
+
+    user_pos = np.searchsorted(model['user_ids'], user_id)
+    if user_pos >= len(model['user_ids']) or model['user_ids'][user_pos] != user_id:
+        print("Пользователь не найден в данных.")
+        return pd.DataFrame()
+
+    # Один k-мерный вектор против матрицы ноутбуков
+    scores = model['item_factors'] @ model['user_factors'][user_pos] + model['global_mean']
+
+    # Исключаем уже оцененные пользователем ноутбуки - строка кэшированной матрицы оценок
+    user_item, user_ids, item_ids = _get_user_item(ratings_csv)
+    rated_pos = np.searchsorted(user_ids, user_id)
+    if rated_pos < len(user_ids) and user_ids[rated_pos] == user_id:
+        scores[np.isin(model['item_ids'], item_ids[user_item[rated_pos].indices])] = -np.inf
+
+    top_idx = top_n_positions(scores, top_n)
+    top_idx = top_idx[np.isfinite(scores[top_idx])]
+    recommended = dict(zip(model['item_ids'][top_idx], scores[top_idx].astype(np.float64)))
+    return _format_user_recommendations(laptops, recommended, top_n)
+
+
+def _user_based_predictions(train, pairs):
+    # Прогнозы user-user для пар (id_user, id_laptop) по той же формуле, что и recommend_laptops_for_user
+    # (разреженный расчет по всем пользователям); пары без прогноза не попадают в результат
+    matrix, user_ids, item_ids = user_item_matrix(train)
+    stats = _user_item_stats(matrix)
+    predictions = {}
+    for user, group in pairs.groupby('id_user'):
+        user_pos = np.searchsorted(user_ids, user)
+        if user_pos >= len(user_ids) or user_ids[user_pos] != user:
+            continue
+        numerator, denominator = _full_numerator_denominator(user_pos, matrix, stats)
+        item_pos = np.searchsorted(item_ids, group['id_laptop'].values).clip(max=len(item_ids) - 1)
+        for laptop, pos in zip(group['id_laptop'].values, item_pos):
+            if item_ids[pos] == laptop and denominator[pos] > 0:
+                predictions[(user, laptop)] = numerator[pos] / denominator[pos]
+    return predictions
+
+
+def compare_with_user_based(laptops_csv, ratings_csv, config=None, test_size=0.2, num_users=50, seed=42):
+    """
+    Сравнение задержки и RMSE: user-user фильтрация против матричной факторизации.
+    RMSE считается по одним и тем же отложенным парам - тем, для которых прогноз есть у обоих движков
+    """
+    import tempfile
+    from recomendation_system import recommend_laptops_for_user
+
+    ratings = pd.read_csv(ratings_csv)
+    test = ratings.sample(frac=test_size, random_state=seed)
+    train = ratings.drop(test.index)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        train_csv = os.path.join(tmp_dir, 'train_ratings.csv')
+        train.to_csv(train_csv, index=False)
+
+        start = time.perf_counter()
+        model = train_als(train, config)
+        train_time = time.perf_counter() - start
+
+        # Пары, известные модели, и среди них - те, для которых есть прогноз user-user
+        known = test[test['id_user'].isin(model['user_ids']) & test['id_laptop'].isin(model['item_ids'])]
+        uu_pred = _user_based_predictions(train, known)
+        common = known[[(u, l) in uu_pred for u, l in zip(known['id_user'], known['id_laptop'])]]
+        actual = common['user_rating'].values
+
+        user_idx = np.searchsorted(model['user_ids'], common['id_user'].values)
+        item_idx = np.searchsorted(model['item_ids'], common['id_laptop'].values)
+        mf_rmse = float(np.sqrt(np.mean((predict_ratings(model, user_idx, item_idx) - actual) ** 2)))
+        uu_values = np.array([uu_pred[(u, l)] for u, l in zip(common['id_user'], common['id_laptop'])])
+        uu_rmse = float(np.sqrt(np.mean((uu_values - actual) ** 2)))
+
+        # Задержка одного запроса top-5; кэши каталога и оценок прогреты, у user-user - его обычный путь
+        users = common['id_user'].drop_duplicates().head(num_users).tolist()
+        recommend_laptops_for_user_mf(users[0], laptops_csv, train_csv, model, top_n=5)
+        start = time.perf_counter()
+        for user in users:
+            recommend_laptops_for_user(user, laptops_csv, train_csv, top_n=5)
+        uu_latency = (time.perf_counter() - start) / max(len(users), 1)
+
+        start = time.perf_counter()
+        for user in users:
+            recommend_laptops_for_user_mf(user, laptops_csv, train_csv, model, top_n=5)
+        mf_latency = (time.perf_counter() - start) / max(len(users), 1)
+
+    result = pd.DataFrame({
+        'engine': ['user-user', 'matrix factorization'],
+        'rmse': [uu_rmse, mf_rmse],
+        'rmse_pairs': [len(common), len(common)],
+        'latency_ms': [uu_latency * 1000, mf_latency * 1000],
+        'train_time_s': [0.0, train_time],
+    })
+    print(result)
+    return result
+
+
+if __name__ == "__main__":
+    config = MFConfig(rank=16, regularization=0.1, epochs=15)
+    train_and_save('data/generated_ratings.csv', 'data/mf_model.npz', config)
+    compare_with_user_based('data/laptops_with_avg_rating.csv', 'data/generated_ratings.csv', config)
@@ -0,0 +1,264 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from instrumentation import span, count
+
+# Общая модель для процессов-обработчиков: один процесс строит массивы (каталог, нормализованные
+# признаки, матрица оценок, граф соседей) и записывает их в файлы .npy отдельной версии, обработчики отображают
+# их в память только для чтения - страницы общие для всех процессов, копий нет. Текущая версия
+# указана в файле current.json, который заменяется атомарно; обработчик переключается на новую
+# версию при следующем обращении, без перезапуска.
+
+MODEL_DIR = 'data/shared_model'
+NEIGHBOR_GRAPH_PATH = 'data/user_neighbors.npz'
+MANIFEST_FILE = 'current.json'
+KEEP_VERSIONS = 2  # старые версии остаются, пока их могут дочитывать обработчики
+
+
+def _manifest_path(model_dir):
+    return os.path.join(model_dir, MANIFEST_FILE)
+
+
+def read_manifest(model_dir=MODEL_DIR):
+    path = _manifest_path(model_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _catalog_arrays(catalog):
+    # Столбцы каталога: числовые как есть, текстовые - строки фиксированной длины (пропуск - '')
+    arrays = {}
+    for col in catalog['df'].columns:
+        values = catalog['df'][col]
+        if pd.api.types.is_numeric_dtype(values):
+            arrays[f'df.{col}'] = values.to_numpy()
+        else:
+            arrays[f'df.{col}'] = values.fillna('').astype(str).to_numpy().astype(np.str_)
+    arrays['feature_matrix'] = catalog['feature_matrix']
+    arrays['unit_features'] = catalog['unit_features']
+    for name, array in catalog['attribute_index'].to_arrays().items():
+        arrays[f'index.{name}'] = array
+    return arrays
+
+
+def publish_model(laptops_csv, ratings_csv, model_dir=MODEL_DIR, keep_versions=KEEP_VERSIONS,
+                  neighbor_graph_path=NEIGHBOR_GRAPH_PATH):
+    """
+    Построить массивы модели и опубликовать их новой версией. Публикует один процесс;
+    обработчики подхватывают версию через SharedModel.refresh. Граф соседей публикуется,
+    если файл neighbor_graph_path построен по текущим оценкам. Возвращает номер версии.
+    """
+    import recomendation_system
+    from quantization import quantize_ratings
+
+    with span('model_sharing.build'):
+        catalog = recomendation_system._get_catalog(laptops_csv)
+        user_item, user_ids, item_ids = recomendation_system._get_user_item(ratings_csv)
+        user_item = user_item.tocsr()
+        user_item.sort_indices()  # отображенные массивы только для чтения, scipy не должен их менять
+        quantized = quantize_ratings(user_item)
+        graph = recomendation_system._get_neighbor_graph(ratings_csv, neighbor_graph_path)
+        if graph is not None:
+            graph = graph.tocsr()
+            graph.sort_indices()
+
+    arrays = _catalog_arrays(catalog)
+    arrays.update({
+        'user_item.data': user_item.data, 'user_item.indices': user_item.indices,
+        'user_item.indptr': user_item.indptr, 'user_ids': user_ids, 'item_ids': item_ids,
+    })
+    arrays.update({f'user_item_int8.{key}': value for key, value in quantized.items()})
+    if graph is not None:
+        # Пользователи графа совпадают с user_ids, отдельно не сохраняются
+        arrays.update({'neighbor_graph.data': graph.data, 'neighbor_graph.indices': graph.indices,
+                       'neighbor_graph.indptr': graph.indptr})
+
+    os.makedirs(model_dir, exist_ok=True)
+    # Публикация могла прерваться между созданием каталога версии и записью манифеста,
+    # поэтому номер берется больше и манифеста, и всех существующих каталогов
+    previous = read_manifest(model_dir)
+    version = max([previous['version'] if previous else 0] + _version_dirs(model_dir)) + 1
+    version_dir = f'v{version:06d}'
+    tmp_dir = os.path.join(model_dir, f'.{version_dir}.tmp')
+
+    with span('model_sharing.publish'):
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), np.ascontiguousarray(array))
+        # Каталог версии появляется целиком, затем на него переключается манифест
+        os.replace(tmp_dir, os.path.join(model_dir, version_dir))
+
+        manifest = {
+            'version': version,
+            'dir': version_dir,
+            'arrays': sorted(arrays),
+            'laptops_csv': laptops_csv,
+            'ratings_csv': ratings_csv,
+            # Время изменения исходных файлов: если они изменятся, обработчик пересоберет кэш сам
+            'mtimes': {'laptops_csv': os.path.getmtime(laptops_csv), 'ratings_csv': os.path.getmtime(ratings_csv)},
+            'catalog_size': len(catalog['df']),
+            'user_item_shape': list(user_item.shape),
+            'scaler': catalog['scaler'],
+        }
+        if graph is not None:
+            manifest['neighbor_graph_path'] = neighbor_graph_path
+            manifest['mtimes']['neighbor_graph'] = os.path.getmtime(neighbor_graph_path)
+            manifest['neighbor_graph_shape'] = list(graph.shape)
+        tmp_manifest = f'{_manifest_path(model_dir)}.tmp'
+        with open(tmp_manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_manifest, _manifest_path(model_dir))
+
+    _remove_old_versions(model_dir, version, keep_versions)
+    print(f"Модель опубликована: версия {version}, массивов {len(arrays)}, каталог {model_dir}/{version_dir}")
+    return version
+
+
+def _version_dirs(model_dir):
+    # Номера версий по каталогам v000001, ... (в том числе не попавших в манифест после сбоя)
+    return [int(name[1:]) for name in os.listdir(model_dir) if name.startswith('v') and name[1:].isdigit()]
+
+
+def _remove_old_versions(model_dir, version, keep_versions):
+    # В Linux удаленные файлы остаются доступны уже отобразившим их процессам; в Windows
+    # отображенный файл удалить нельзя - такая версия будет удалена при следующей публикации
+    for old in _version_dirs(model_dir):
+        if old <= version - keep_versions:
+            shutil.rmtree(os.path.join(model_dir, f'v{old:06d}'), ignore_errors=True)
+
+
+def attach_arrays(model_dir, manifest):
+    """Массивы версии как представления NumPy только для чтения поверх файлов, без копирования"""
+    version_dir = os.path.join(model_dir, manifest['dir'])
+    return {name: np.load(os.path.join(version_dir, f'{name}.npy'), mmap_mode='r') for name in manifest['arrays']}
+
+
+def _prefixed(arrays, prefix):
+    return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+
+def build_engine_cache(manifest, arrays):
+    """Записи кэша recomendation_system поверх отображенных массивов (ключ (имя, путь) -> (mtime, данные), как в _cached)"""
+    from laptop_filters import AttributeIndex
+
+    # DataFrame каталога (небольшой) собирается в каждом процессе, матрицы признаков,
+    # индексы фильтров, оценки и граф соседей остаются общими отображенными массивами
+    df = pd.DataFrame({col: array if array.dtype.kind != 'U' else pd.Series(array).replace('', np.nan)
+                       for col, array in _prefixed(arrays, 'df.').items()})
+    catalog = {
+        'df': df,
+        'scaler': manifest['scaler'],
+        'feature_matrix': arrays['feature_matrix'],
+        'unit_features': arrays['unit_features'],
+        'laptop_id_to_idx': {laptop_id: idx for idx, laptop_id in enumerate(df['id_laptop'])},
+        'attribute_index': AttributeIndex.from_arrays(manifest['catalog_size'], _prefixed(arrays, 'index.')),
+    }
+    user_item = sparse.csr_matrix(
+        (arrays['user_item.data'], arrays['user_item.indices'], arrays['user_item.indptr']),
+        shape=tuple(manifest['user_item_shape'])
+    )
+    user_item.has_sorted_indices = True
+
+    laptops_mtime = manifest['mtimes']['laptops_csv']
+    ratings_mtime = manifest['mtimes']['ratings_csv']
+    cache = {
+        ('catalog', manifest['laptops_csv']): (laptops_mtime, catalog),
+        ('user_item', manifest['ratings_csv']): (ratings_mtime, (user_item, arrays['user_ids'], arrays['item_ids'])),
+        ('user_item_int8', manifest['ratings_csv']): (ratings_mtime, _prefixed(arrays, 'user_item_int8.')),
+    }
+    if 'neighbor_graph_path' in manifest:
+        graph = sparse.csr_matrix(
+            (arrays['neighbor_graph.data'], arrays['neighbor_graph.indices'], arrays['neighbor_graph.indptr']),
+            shape=tuple(manifest['neighbor_graph_shape'])
+        )
+        graph.has_sorted_indices = True
+        cache[('neighbor_graph', manifest['neighbor_graph_path'])] = (manifest['mtimes']['neighbor_graph'],
+                                                                       (graph, arrays['user_ids']))
+    return cache
+
+
+class SharedModel:
+    """Подключение процесса-обработчика к опубликованной модели"""
+
+    def __init__(self, model_dir=MODEL_DIR):
+        self.model_dir = model_dir
+        self.version = None
+        self.manifest = None
+        self.arrays = None
+        self._manifest_mtime = None
+
+    def refresh(self):
+        """
+        Проверить текущую версию и при смене переключиться на нее: массивы новой версии
+        отображаются в память и подставляются в кэш recomendation_system. Возвращает версию.
+        """
+        path = _manifest_path(self.model_dir)
+        mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        if mtime == self._manifest_mtime:
+            return self.version
+
+        manifest = read_manifest(self.model_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"Модель не опубликована: нет файла {path}")
+        if manifest['version'] != self.version:
+            import recomendation_system
+
+            with span('model_sharing.attach'):
+                arrays = attach_arrays(self.model_dir, manifest)
+                recomendation_system.load_cache(build_engine_cache(manifest, arrays))
+            # Старые массивы освобождаются, когда на них не останется ссылок
+            self.manifest, self.arrays, self.version = manifest, arrays, manifest['version']
+            count('model_sharing.swaps')
+        self._manifest_mtime = mtime
+        return self.version
+
+
+_worker_model = None
+
+
+def init_worker(model_dir=MODEL_DIR):
+    # initializer для ProcessPoolExecutor: подключение к модели при старте процесса
+    global _worker_model
+    _worker_model = SharedModel(model_dir)
+    _worker_model.refresh()
+
+
+def recommend_for_user(user_id, top_n=5, **kwargs):
+    """
+    Задача для обработчика: рекомендации по текущей опубликованной версии модели. Общие массивы
+    используют режимы, работающие по кэшированной матрице оценок: compact=True, hybrid и граф соседей
+    (neighbor_graph_path из манифеста, если граф опубликован)
+    """
+    import recomendation_system
+
+    version = _worker_model.refresh()
+    manifest = _worker_model.manifest
+    recommendations = recomendation_system.recommend_laptops_for_user(
+        user_id, manifest['laptops_csv'], manifest['ratings_csv'], top_n=top_n, **kwargs
+    )
+    return os.getpid(), version, recommendations
+
+
+if __name__ == "__main__":
+    from functools import partial
+    from concurrent.futures import ProcessPoolExecutor
+
+    laptops_path, ratings_path = 'data/laptops_with_avg_rating.csv', 'data/generated_ratings.csv'
+    publish_model(laptops_path, ratings_path)
+    users = pd.read_csv(ratings_path)['id_user'].drop_duplicates().head(8).tolist()
+
+    with ProcessPoolExecutor(max_workers=4, initializer=init_worker) as executor:
+        task = partial(recommend_for_user, top_n=5, neighbor_graph_path=NEIGHBOR_GRAPH_PATH)
+        for pid, version, result in executor.map(task, users, chunksize=1):
+            print(f"Процесс {pid}, версия модели {version}, рекомендаций: {len(result)}")
+
+        # Новая версия подхватывается уже запущенными процессами
+        publish_model(laptops_path, ratings_path)
+        for pid, version, result in executor.map(task, users, chunksize=1):
+            print(f"Процесс {pid}, версия модели {version}, рекомендаций: {len(result)}")
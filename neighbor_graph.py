@@ -0,0 +1,126 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from instrumentation import span
+
+
+def user_item_matrix(ratings_df):
+    """Разреженная матрица пользователь x ноутбук и соответствующие id"""
+    user_ids, user_idx = np.unique(ratings_df['id_user'].values, return_inverse=True)
+    item_ids, item_idx = np.unique(ratings_df['id_laptop'].values, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (ratings_df['user_rating'].values.astype(np.float64), (user_idx, item_idx)),
+        shape=(len(user_ids), len(item_ids))
+    )
+    matrix.eliminate_zeros()  # оценка 0 считается отсутствием оценки, как в pivot(...).fillna(0)
+    return matrix, user_ids, item_ids
+
+
+def _block_size(num_users, num_items, k, memory_limit_mb):
+    # Рабочие буферы на блок из b строк и b столбцов, все учитываются в лимите:
+    #   плотная копия блока столбцов ноутбук x b (float64) - 8*num_items*b;
+    #   плотный блок схожестей b x b (float64) и результат argpartition по нему (int64) - 16*b*b;
+    #   top-K блока, текущий top-K и кандидаты для слияния (2K значений и индексов) - 80*b*k
+    # Входная матрица оценок и сам граф на выходе (N*K ребер) в лимит не входят
+    limit = memory_limit_mb * 1024 * 1024
+    linear = 8 * num_items + 80 * k
+    side = int((-linear + np.sqrt(linear ** 2 + 64 * limit)) / 32)
+    return max(1, min(side, num_users))
+
+
+def _block_top_k(sims, k):
+    # top-K столбцов каждой строки блока без копии -sims: k наибольших стоят в конце после argpartition
+    if sims.shape[1] <= k:
+        return sims, np.broadcast_to(np.arange(sims.shape[1]), sims.shape)
+    # copy: срез иначе держал бы в памяти весь результат argpartition размером с блок
+    cols = np.argpartition(sims, sims.shape[1] - k, axis=1)[:, -k:].copy()
+    return np.take_along_axis(sims, cols, axis=1), cols
+
+
+def build_neighbor_graph(ratings_csv, k=50, memory_limit_mb=64, save_path=None, ratings_df=None):
+    """
+    Граф top-K похожих пользователей (косинусная схожесть), построенный блоками строк и столбцов
+    без плотной матрицы N x N. В каждом блоке столбцов сначала отбираются свои top-K, затем они
+    сливаются с текущим top-K строки (2K кандидатов), так что в памяти нет массивов шириной K + блок.
+    """
+    # ratings_df - уже загруженные оценки (например, с оверлеем RatingStore) вместо чтения файла
+    ratings = ratings_df if ratings_df is not None else pd.read_csv(ratings_csv)
+    matrix, user_ids, item_ids = user_item_matrix(ratings)
+    num_users = matrix.shape[0]
+
+    norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+    norms[norms == 0] = 1
+    unit = (sparse.diags(1 / norms) @ matrix).tocsr()
+    unit_t = unit.T.tocsc()
+
+    block = _block_size(num_users, matrix.shape[1], k, memory_limit_mb)
+    indptr = [0]
+    indices, data = [], []
+
+    start_time = time.perf_counter()
+    for row_start in range(0, num_users, block):
+        row_end = min(row_start + block, num_users)
+        rows = row_end - row_start
+        row_block = unit[row_start:row_end]
+
+        top_vals = np.full((rows, k), -np.inf)
+        top_cols = np.full((rows, k), -1, dtype=np.int64)
+
+        for col_start in range(0, num_users, block):
+            col_end = min(col_start + block, num_users)
+            with span('neighbor_graph.block_product'):
+                # Разреженный блок строк на плотный блок столбцов - результат сразу плотный,
+                # без промежуточной разреженной матрицы b x b
+                sims = row_block @ unit_t[:, col_start:col_end].toarray()
+
+            # Исключаем самого пользователя
+            diag_rows = np.arange(max(row_start, col_start), min(row_end, col_end))
+            sims[diag_rows - row_start, diag_rows - col_start] = -np.inf
+
+            # top-K блока, затем слияние с текущим top-K
+            block_vals, block_cols = _block_top_k(sims, k)
+            del sims
+            cand_vals = np.hstack([top_vals, block_vals])
+            cand_cols = np.hstack([top_cols, block_cols + col_start])
+            keep = np.argpartition(cand_vals, cand_vals.shape[1] - k, axis=1)[:, -k:]
+            top_vals = np.take_along_axis(cand_vals, keep, axis=1)
+            top_cols = np.take_along_axis(cand_cols, keep, axis=1)
+
+        # В граф попадают только соседи с положительной схожестью, по убыванию схожести
+        order = np.argsort(-top_vals, axis=1)
+        top_vals = np.take_along_axis(top_vals, order, axis=1)
+        top_cols = np.take_along_axis(top_cols, order, axis=1)
+        positive = top_vals > 0
+        indices.append(top_cols[positive].astype(np.int32))
+        data.append(top_vals[positive].astype(np.float32))
+        indptr.extend(indptr[-1] + np.cumsum(positive.sum(axis=1)))
+
+    graph = sparse.csr_matrix(
+        (np.concatenate(data), np.concatenate(indices), np.array(indptr)),
+        shape=(num_users, num_users)
+    )
+    print(f"Граф соседей построен за {time.perf_counter() - start_time:.2f} с, блок {block} строк, "
+          f"ребер: {graph.nnz}")
+
+    if save_path:
+        # Запись во временный файл и замена: граф могут читать во время перестройки
+        tmp_path = f'{save_path}.tmp.npz'
+        np.savez(tmp_path, data=graph.data, indices=graph.indices, indptr=graph.indptr,
+                 shape=graph.shape, user_ids=user_ids)
+        os.replace(tmp_path, save_path)
+        print(f"Граф соседей сохранен в файл: {save_path}")
+
+    return graph, user_ids
+
+
+def load_neighbor_graph(path):
+    with np.load(path) as data:
+        graph = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+        return graph, data['user_ids']
+
+
+if __name__ == "__main__":
+    build_neighbor_graph('data/generated_ratings.csv', k=50, memory_limit_mb=64,
+                         save_path='data/user_neighbors.npz')
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+# Сегменты для холодного старта: границы цен, объемов RAM и диагоналей
+PRICE_BANDS = [0, 40000, 60000, 90000, 150000, np.inf]
+PRICE_LABELS = ['<40000', '40000-60000', '60000-90000', '90000-150000', '>150000']
+RAM_TIERS = [0, 8, 16, np.inf]
+RAM_LABELS = ['<=8', '9-16', '>16']
+DISPLAY_CLASSES = [0, 14, 15.6, np.inf]
+DISPLAY_LABELS = ['<14', '14-15.5', '>=15.6']
+
+SEGMENT_NAMES = {'global': 'Все ноутбуки', 'price_band': 'Цена', 'os': 'ОС', 'ram': 'RAM (ГБ)',
+                 'display': 'Диагональ'}
+
+LEADERBOARD_COLUMNS = ['segment', 'value', 'rank', 'id_laptop', 'title', 'price', 'weighted_rating', 'v', 'R']
+
+
+def compute_segment_leaderboards(laptops_csv, ratings_csv, top_n=10, save_path=None):
+    """
+    Топы ноутбуков по взвешенному рейтингу (WR) глобально и по сегментам:
+    ценовой диапазон, OS_Name, объем RAM и диагональ. Все топы считаются за один проход.
+    """
+    laptops = pd.read_csv(laptops_csv).drop_duplicates('id_laptop')
+    ratings = pd.read_csv(ratings_csv)
+
+    # R и v по ноутбукам, C и m - как в get_top_laptops_by_tmdb_rating
+    summary = ratings.groupby('id_laptop')['user_rating'].agg(R='mean', v='count').reset_index()
+    C = summary['R'].mean()
+    m = summary['v'].quantile(0.90)
+    summary['weighted_rating'] = (summary['v'] / (summary['v'] + m)) * summary['R'] + \
+                                 (m / (summary['v'] + m)) * C
+
+    rated = summary.merge(laptops, on='id_laptop')
+    rated['price_band'] = pd.cut(rated['price'], PRICE_BANDS, labels=PRICE_LABELS, right=False)
+    rated['ram_tier'] = pd.cut(rated['RAM_GB'], RAM_TIERS, labels=RAM_LABELS)
+    rated['display_class'] = pd.cut(rated['Display_inch'], DISPLAY_CLASSES, labels=DISPLAY_LABELS, right=False)
+    rated['os_name'] = _decode_os_names(rated['OS_Name'], laptops_csv)
+
+    # Глобальный топ требует v >= m, как и исходная формула; в сегментах ноутбуков мало,
+    # поэтому там ранжируются все оцененные модели - WR и так сжимает малые выборки к C
+    segments = [rated[rated['v'] >= m].assign(segment='global', value='all')]
+    for segment, column in [('price_band', 'price_band'), ('os', 'os_name'),
+                            ('ram', 'ram_tier'), ('display', 'display_class')]:
+        segments.append(rated.assign(segment=segment, value=rated[column].astype(str)))
+    long = pd.concat(segments, ignore_index=True)
+
+    long = long.sort_values(['segment', 'value', 'weighted_rating'], ascending=[True, True, False])
+    long['rank'] = long.groupby(['segment', 'value']).cumcount() + 1
+    leaderboards = long[long['rank'] <= top_n][LEADERBOARD_COLUMNS].reset_index(drop=True)
+
+    if save_path:
+        leaderboards.to_csv(save_path, index=False)
+        print(f"Топы по сегментам сохранены в файл: {save_path}")
+    return leaderboards
+
+
+def _decode_os_names(codes, laptops_csv):
+    # OS_Name в каталоге закодирован LabelEncoder; названия берутся из сохраненного словаря кодов
+    from catalog_state import load_state, state_path_for
+
+    state = load_state(state_path_for(laptops_csv))
+    if state is None:
+        print("Нет словаря кодов каталога (catalog_state.py), сегменты ОС подписаны кодами")
+        return codes.astype(str)
+    vocabulary = state['encodings']['OS_Name']
+    return codes.map(lambda code: vocabulary[code] if 0 <= code < len(vocabulary) else str(code))
+
+
+def load_segment_leaderboards(path):
+    """Словарь (сегмент, значение) -> топ, отсортированный по rank"""
+    table = pd.read_csv(path, dtype={'value': str})
+    return {key: group.reset_index(drop=True) for key, group in table.groupby(['segment', 'value'])}
+
+
+def segment_label(segment, value):
+    if segment == 'global':
+        return SEGMENT_NAMES[segment]
+    return f"{SEGMENT_NAMES.get(segment, segment)}: {value}"
+
+
+def get_segment_top(leaderboards, segment='global', value='all', top_n=5):
+    group = leaderboards.get((segment, str(value)))
+    if group is None:
+        return pd.DataFrame(columns=LEADERBOARD_COLUMNS)
+    return group.head(top_n)
+
+
+if __name__ == "__main__":
+    compute_segment_leaderboards('data/laptops_with_avg_rating.csv', 'data/generated_ratings.csv',
+                                 top_n=10, save_path='data/segment_popularity.csv')
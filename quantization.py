@@ -0,0 +1,222 @@
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Компактное хранение матриц для расчета схожести: uint8/int8 с масштабом и смещением
+# по каждому столбцу или float16. Скоринг идет блоками строк, блок разжимается в float32.
+# Для признаков каталога это только экономия памяти: на 771 x 6 сжатый расчет в десятки раз
+# медленнее одного умножения float64 и менее точен (см. compare_quantized), поэтому
+# recommend_similar_laptops работает с float64.
+
+QUANTIZED_DTYPES = {'uint8': np.uint8, 'int8': np.int8, 'float16': np.float16}
+
+
+def quantize_columns(matrix, mode='uint8'):
+    """Сжатие матрицы по столбцам: x ~ q * scale + offset"""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if mode == 'float16':
+        values = matrix.astype(np.float16)
+        scale = np.ones(matrix.shape[1], dtype=np.float32)
+        offset = np.zeros(matrix.shape[1], dtype=np.float32)
+    elif mode in ('uint8', 'int8'):
+        info = np.iinfo(QUANTIZED_DTYPES[mode])
+        col_min = matrix.min(axis=0)
+        col_range = matrix.max(axis=0) - col_min
+        scale = np.where(col_range > 0, col_range / (info.max - info.min), 1.0)
+        offset = col_min - info.min * scale
+        values = np.clip(np.rint((matrix - offset) / scale), info.min, info.max).astype(QUANTIZED_DTYPES[mode])
+        scale, offset = scale.astype(np.float32), offset.astype(np.float32)
+    else:
+        raise ValueError(f"Неизвестный режим сжатия: {mode}")
+
+    quantized = {'values': values, 'scale': scale, 'offset': offset}
+    # Нормы строк по разжатым значениям - для косинусной схожести
+    quantized['norms'] = np.concatenate([
+        np.linalg.norm(block, axis=1) for block in iter_dequantized_blocks(quantized)
+    ]) if len(values) else np.zeros(0, dtype=np.float32)
+    return quantized
+
+
+def dequantize(quantized, rows=slice(None)):
+    return quantized['values'][rows].astype(np.float32) * quantized['scale'] + quantized['offset']
+
+
+def iter_dequantized_blocks(quantized, block_rows=4096):
+    for start in range(0, len(quantized['values']), block_rows):
+        yield dequantize(quantized, slice(start, start + block_rows))
+
+
+def nbytes(quantized):
+    return sum(value.nbytes for value in quantized.values())
+
+
+def blocked_cosine_scores(quantized, target_pos, candidates=None, block_rows=4096):
+    """Косинусная схожесть строки target_pos со строками candidates (по умолчанию - со всеми)"""
+    target = dequantize(quantized, target_pos)
+    target_norm = quantized['norms'][target_pos]
+    if candidates is None:
+        candidates = np.arange(len(quantized['values']))
+
+    # (q * scale + offset) @ t = q @ (scale * t) + offset @ t - блок не разжимается целиком
+    weights = quantized['scale'] * target
+    bias = quantized['offset'] @ target
+
+    scores = np.empty(len(candidates), dtype=np.float32)
+    for start in range(0, len(candidates), block_rows):
+        rows = candidates[start:start + block_rows]
+        norms = quantized['norms'][rows] * target_norm
+        dots = quantized['values'][rows] @ weights + bias
+        scores[start:start + block_rows] = np.divide(dots, norms, out=np.zeros(len(rows), dtype=np.float32),
+                                                     where=norms > 0)
+    return scores
+
+
+def quantize_ratings(user_item):
+    """
+    Оценки 0-5 - целые числа, поэтому int8 без масштаба хранит их без потерь. Сжимаются только
+    ненулевые значения разреженной матрицы (data), структура CSR (indices, indptr) сохраняется.
+    """
+    matrix = sparse.csr_matrix(user_item)
+    data = matrix.data.astype(np.int8)
+    norms = np.sqrt(np.add.reduceat(data.astype(np.int32) ** 2, matrix.indptr[:-1])) \
+        if matrix.nnz else np.zeros(matrix.shape[0])
+    # reduceat для пустых строк возвращает значение следующей строки - у них норма 0
+    norms[np.diff(matrix.indptr) == 0] = 0
+    return {
+        'data': data,
+        'indices': matrix.indices,
+        'indptr': matrix.indptr,
+        'shape': np.array(matrix.shape),
+        'norms': norms.astype(np.float32),
+    }
+
+
+def _ratings_block(quantized_ratings, start, end, ones=False):
+    # Строки [start, end) как CSR float32; копируется только этот блок
+    indptr = quantized_ratings['indptr']
+    lo, hi = indptr[start], indptr[end]
+    data = np.ones(hi - lo, dtype=np.float32) if ones else quantized_ratings['data'][lo:hi].astype(np.float32)
+    return sparse.csr_matrix((data, quantized_ratings['indices'][lo:hi], indptr[start:end + 1] - lo),
+                             shape=(end - start, int(quantized_ratings['shape'][1])))
+
+
+def rated_positions(quantized_ratings, user_pos):
+    indptr = quantized_ratings['indptr']
+    return quantized_ratings['indices'][indptr[user_pos]:indptr[user_pos + 1]]
+
+
+def blocked_user_scores(quantized_ratings, user_pos, block_rows=4096):
+    """
+    Прогноз оценок пользователя как в recommend_laptops_for_user: взвешенное среднее оценок
+    всех остальных пользователей с косинусной схожестью в качестве весов. Возвращает
+    числитель и знаменатель по всем ноутбукам; матрица разжимается в float32 блоками строк.
+    """
+    num_users, num_items = (int(x) for x in quantized_ratings['shape'])
+    norms = quantized_ratings['norms']
+    target = _ratings_block(quantized_ratings, user_pos, user_pos + 1).toarray().ravel()
+    target_norm = norms[user_pos]
+
+    numerator = np.zeros(num_items, dtype=np.float32)
+    denominator = np.zeros(num_items, dtype=np.float32)
+    for start in range(0, num_users, block_rows):
+        end = min(start + block_rows, num_users)
+        block = _ratings_block(quantized_ratings, start, end)
+        block_norms = norms[start:end] * target_norm
+        sims = np.divide(block @ target, block_norms, out=np.zeros(end - start, dtype=np.float32),
+                         where=block_norms > 0)
+        if start <= user_pos < end:
+            sims[user_pos - start] = 0  # исключаем самого пользователя
+        numerator += block.T @ sims
+        denominator += _ratings_block(quantized_ratings, start, end, ones=True).T @ sims
+    return numerator, denominator
+
+
+def _top_k_overlap(exact, approx, k):
+    # Доля выбранных по сжатым данным элементов, которые входят в точный top-K.
+    # Равные точные оценки (частый случай для прогнозов 5.0) считаются взаимозаменяемыми
+    approx_top = np.argsort(-approx, kind='stable')[:k]
+    kth_best = np.sort(exact)[::-1][min(k, len(exact)) - 1]
+    return float(np.mean(exact[approx_top] >= kth_best - 1e-9))
+
+
+def _without(scores, pos):
+    # Исключить сам запрос из top-K
+    scores = scores.copy()
+    scores[pos] = -np.inf
+    return scores
+
+
+def compare_quantized(laptops_csv, ratings_csv, k=5, num_queries=200, mode='uint8', seed=42):
+    """Память, скорость и совпадение top-K для сжатых и точных (float64) матриц"""
+    from recomendation_system import _get_catalog, _get_user_item, _user_item_stats, _full_numerator_denominator
+
+    rng = np.random.default_rng(seed)
+    results = []
+
+    # Контентная схожесть по нормализованным признакам
+    feature_matrix = _get_catalog(laptops_csv)['feature_matrix']
+    quantized = quantize_columns(feature_matrix, mode)
+    unit = feature_matrix / np.linalg.norm(feature_matrix, axis=1, keepdims=True).clip(min=1e-12)
+    queries = rng.choice(len(feature_matrix), size=min(num_queries, len(feature_matrix)), replace=False)
+
+    start = time.perf_counter()
+    exact_scores = [unit @ unit[q] for q in queries]
+    exact_time = time.perf_counter() - start
+    start = time.perf_counter()
+    approx_scores = [blocked_cosine_scores(quantized, q) for q in queries]
+    approx_time = time.perf_counter() - start
+    overlap = np.mean([_top_k_overlap(_without(e, q), _without(a, q), k)
+                       for q, e, a in zip(queries, exact_scores, approx_scores)])
+    results.append({
+        'matrix': 'features', 'mode': mode,
+        'float64_bytes': feature_matrix.nbytes, 'quantized_bytes': nbytes(quantized),
+        'float64_qps': len(queries) / exact_time, 'quantized_qps': len(queries) / approx_time,
+        f'top{k}_overlap': overlap,
+    })
+
+    # Матрица пользователь x ноутбук для user-user фильтрации: точный расчет - тот же,
+    # что в recommend_laptops_for_user, по разреженной матрице float64. Нормы в обоих случаях
+    # посчитаны заранее, чтобы разница в скорости относилась только к сжатию
+    user_item = _get_user_item(ratings_csv)[0]
+    stats = _user_item_stats(user_item)
+    quantized_ratings = quantize_ratings(user_item)
+    users = rng.choice(user_item.shape[0], size=min(num_queries, user_item.shape[0]), replace=False)
+
+    def predictions(num, den, rated):
+        pred = np.divide(num, den, out=np.full(len(num), -np.inf), where=den > 0)
+        pred[rated] = -np.inf
+        return pred
+
+    def exact_user(u):
+        num, den = _full_numerator_denominator(u, user_item, stats)
+        return predictions(num, den, user_item[u].indices)
+
+    def approx_user(u):
+        num, den = blocked_user_scores(quantized_ratings, u)
+        return predictions(num.astype(np.float64), den.astype(np.float64), rated_positions(quantized_ratings, u))
+
+    start = time.perf_counter()
+    exact_preds = [exact_user(u) for u in users]
+    exact_time = time.perf_counter() - start
+    start = time.perf_counter()
+    approx_preds = [approx_user(u) for u in users]
+    approx_time = time.perf_counter() - start
+    csr_bytes = user_item.data.nbytes + user_item.indices.nbytes + user_item.indptr.nbytes
+    results.append({
+        'matrix': 'user_item (CSR)', 'mode': 'int8',
+        'float64_bytes': csr_bytes, 'quantized_bytes': nbytes(quantized_ratings),
+        'float64_qps': len(users) / exact_time, 'quantized_qps': len(users) / approx_time,
+        f'top{k}_overlap': np.mean([_top_k_overlap(e, a, k) for e, a in zip(exact_preds, approx_preds)]),
+    })
+
+    report = pd.DataFrame(results)
+    report['memory_saved'] = 1 - report['quantized_bytes'] / report['float64_bytes']
+    report['speedup'] = report['quantized_qps'] / report['float64_qps']  # < 1 - сжатый расчет медленнее
+    print(report.to_string(index=False))
+    return report
+
+
+if __name__ == "__main__":
+    for compression_mode in ('uint8', 'float16'):
+        compare_quantized('data/laptops_with_avg_rating.csv', 'data/generated_ratings.csv', mode=compression_mode)
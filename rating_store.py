@@ -0,0 +1,274 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import pandas as pd
+from instrumentation import span, count
+
+# Запись оценок: событие сначала дописывается в журнал (append-only) и сразу видно читателям
+# через оверлей в памяти; fsync выполняется пачками. Фоновая компактация переносит журнал
+# в основной файл оценок и обновляет средние оценки ноутбуков.
+
+LOG_COLUMNS = ['id_laptop', 'id_user', 'user_rating', 'ts']
+RATING_VALUES = range(0, 6)
+
+
+class RatingStore:
+    def __init__(self, ratings_csv='data/generated_ratings.csv', laptops_csv='data/laptops_with_avg_rating.csv',
+                 log_path='data/ratings_log.csv', base_df=None, fsync_batch=64, fsync_interval=0.5):
+        self.ratings_csv = ratings_csv
+        self.laptops_csv = laptops_csv
+        self.log_path = log_path
+        self.compacting_path = f'{log_path}.compacting'
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._base = base_df if base_df is not None else pd.read_csv(ratings_csv)
+        self._overlay = {}  # (id_user, id_laptop) -> оценка, еще не перенесенная в основной файл
+        self._pending_sync = 0
+        self._closed = False
+
+        # Агрегаты по ноутбукам: сумма и количество оценок с учетом оверлея
+        grouped = self._base.groupby('id_laptop')['user_rating'].agg(['sum', 'count'])
+        self._sums = grouped['sum'].astype(float).to_dict()
+        self._counts = grouped['count'].to_dict()
+        self._base_index = {(u, l): r for l, u, r in self._base[['id_laptop', 'id_user', 'user_rating']].values}
+
+        # Журнал прерванной компактации возвращается на диск перед текущим журналом: иначе
+        # следующая компактация заменила бы его файл, и события остались бы только в памяти
+        if os.path.exists(self.compacting_path):
+            if os.path.exists(self.log_path):
+                _append_file(self.log_path, self.compacting_path)
+            os.replace(self.compacting_path, self.log_path)
+
+        # Восстановление событий, не попавших в основной файл до прошлого завершения
+        if os.path.exists(self.log_path):
+            for row in pd.read_csv(self.log_path, names=LOG_COLUMNS).itertuples(index=False):
+                self._apply(row.id_user, row.id_laptop, row.user_rating)
+
+        # Версия оверлея: растет с каждой оценкой, по ней recomendation_system сбрасывает кэш
+        self.version = 0
+        self._log = open(self.log_path, 'a', encoding='utf-8')
+        self._sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
+        self._sync_thread.start()
+        self._compaction_thread = None
+
+    def _current(self, id_user, id_laptop):
+        key = (id_user, id_laptop)
+        if key in self._overlay:
+            return self._overlay[key]
+        return self._base_index.get(key)
+
+    def _apply(self, id_user, id_laptop, rating):
+        # Повторная оценка того же ноутбука заменяет предыдущую
+        previous = self._current(id_user, id_laptop)
+        if previous is None:
+            self._counts[id_laptop] = self._counts.get(id_laptop, 0) + 1
+            self._sums[id_laptop] = self._sums.get(id_laptop, 0.0) + rating
+        else:
+            self._sums[id_laptop] += rating - previous
+        self._overlay[(id_user, id_laptop)] = rating
+
+    def ingest(self, id_user, id_laptop, rating, sync=False):
+        """Добавить оценку; sync=True - дождаться fsync журнала"""
+        id_user, id_laptop, rating = int(id_user), int(id_laptop), int(rating)
+        if rating not in RATING_VALUES:
+            raise ValueError(f"Оценка должна быть от {RATING_VALUES.start} до {RATING_VALUES.stop - 1}")
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Хранилище оценок закрыто")
+            self._log.write(f'{id_laptop},{id_user},{rating},{time.time():.6f}\n')
+            self._apply(id_user, id_laptop, rating)
+            self.version += 1
+            self._pending_sync += 1
+            count('ratings.ingested')
+            if sync or self._pending_sync >= self.fsync_batch:
+                self._sync()
+
+    def _sync(self):
+        if self._pending_sync == 0:
+            return
+        with span('ratings.fsync'):
+            self._log.flush()
+            os.fsync(self._log.fileno())
+        self._pending_sync = 0
+
+    def flush(self):
+        with self._lock:
+            self._sync()
+
+    def _sync_loop(self):
+        # Досинхронизация неполной пачки по таймеру
+        while not self._closed:
+            time.sleep(self.fsync_interval)
+            with self._lock:
+                if not self._closed:
+                    self._sync()
+
+    def user_ratings(self, id_user):
+        """Оценки пользователя с учетом еще не компактированных событий"""
+        with self._lock:
+            base = self._base[self._base['id_user'] == id_user]
+            rated = {l: r for l, r in base[['id_laptop', 'user_rating']].values}
+            for (user, laptop), rating in self._overlay.items():
+                if user == id_user:
+                    rated[laptop] = rating
+        return pd.DataFrame({'id_laptop': list(rated), 'id_user': id_user, 'user_rating': list(rated.values())},
+                            columns=['id_laptop', 'id_user', 'user_rating'])
+
+    def average_rating(self, id_laptop):
+        with self._lock:
+            num = self._counts.get(id_laptop, 0)
+            return self._sums[id_laptop] / num if num else None
+
+    def ratings_df(self):
+        """Все оценки: основной файл плюс оверлей"""
+        with self._lock:
+            return self._merged(dict(self._overlay))
+
+    def _merged(self, overlay):
+        if not overlay:
+            return self._base.copy()
+        updates = pd.DataFrame(
+            [(laptop, user, rating) for (user, laptop), rating in overlay.items()],
+            columns=['id_laptop', 'id_user', 'user_rating']
+        )
+        merged = pd.concat([self._base, updates], ignore_index=True)
+        return merged.drop_duplicates(['id_user', 'id_laptop'], keep='last').reset_index(drop=True)
+
+    def compact(self):
+        """Перенос журнала в основной файл оценок и обновление средних оценок ноутбуков"""
+        with self._compact_lock:
+            with self._lock:
+                if self._closed or not self._overlay:
+                    return 0
+                # Текущий журнал откладывается, новые события пишутся в новый файл
+                self._sync()
+                self._log.close()
+                if os.path.exists(self.compacting_path):
+                    # Прошлая компактация не удалась: ее события сохраняются, журнал дописывается к ним
+                    _append_file(self.log_path, self.compacting_path)
+                    os.remove(self.log_path)
+                else:
+                    os.replace(self.log_path, self.compacting_path)
+                self._log = open(self.log_path, 'a', encoding='utf-8')
+                overlay = dict(self._overlay)
+                averages = {laptop: self._sums[laptop] / self._counts[laptop]
+                            for laptop in {laptop for _, laptop in overlay}}
+
+            with span('ratings.compact'):
+                merged = self._merged(overlay)
+                _atomic_write_csv(merged, self.ratings_csv)
+                self._update_averages(averages)
+
+            with self._lock:
+                self._base = merged
+                for key, rating in overlay.items():
+                    self._base_index[key] = rating
+                    # Событие могло быть перезаписано во время компактации - тогда оно остается в оверлее
+                    if self._overlay.get(key) == rating:
+                        del self._overlay[key]
+            os.remove(self.compacting_path)
+            count('ratings.compacted', len(overlay))
+            return len(overlay)
+
+    def _update_averages(self, averages):
+        # Меняется только столбец average_rating у затронутых ноутбуков, без повторного merge
+        if not self.laptops_csv or not os.path.exists(self.laptops_csv):
+            return
+        laptops = pd.read_csv(self.laptops_csv)
+        rows = laptops['id_laptop'].isin(averages.keys())
+        laptops.loc[rows, 'average_rating'] = laptops.loc[rows, 'id_laptop'].map(averages)
+        _atomic_write_csv(laptops, self.laptops_csv)
+
+    def start_background_compaction(self, interval=5.0, min_events=1):
+        def loop():
+            while not self._closed:
+                time.sleep(interval)
+                if not self._closed and len(self._overlay) >= min_events:
+                    try:
+                        self.compact()
+                    except Exception as e:
+                        print(f"Ошибка компактации журнала оценок: {e}")
+
+        self._compaction_thread = threading.Thread(target=loop, daemon=True)
+        self._compaction_thread.start()
+        return self
+
+    def close(self):
+        # Ждем окончания идущей компактации, неперенесенные события остаются в журнале
+        with self._compact_lock, self._lock:
+            self._sync()
+            self._closed = True
+            self._log.close()
+
+
+def _append_file(src_path, dst_path):
+    # Дописать содержимое src_path в конец dst_path с fsync; повтор после сбоя безопасен,
+    # так как повторно примененное событие журнала не меняет состояние
+    needs_newline = False
+    if os.path.getsize(dst_path) > 0:
+        # Строка, оборванная сбоем, не должна склеиться с первой дописанной
+        with open(dst_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b'\n'
+    with open(src_path, 'rb') as src, open(dst_path, 'ab') as dst:
+        if needs_newline:
+            dst.write(b'\n')
+        shutil.copyfileobj(src, dst)
+        dst.flush()
+        os.fsync(dst.fileno())
+
+
+def _atomic_write_csv(df, path):
+    tmp_path = f'{path}.tmp'
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def benchmark_ingest(ratings_csv, laptops_csv, num_events=5000, fsync_batch=64):
+    """Пропускная способность записи, задержка чтения после записи и время компактации"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for batch in (1, fsync_batch):
+            tmp_ratings = shutil.copy(ratings_csv, os.path.join(tmp_dir, f'ratings_{batch}.csv'))
+            tmp_laptops = shutil.copy(laptops_csv, os.path.join(tmp_dir, f'laptops_{batch}.csv'))
+            store = RatingStore(tmp_ratings, tmp_laptops, os.path.join(tmp_dir, f'log_{batch}.csv'),
+                                fsync_batch=batch)
+            laptop_ids = store._base['id_laptop'].unique()
+
+            start = time.perf_counter()
+            for i in range(num_events):
+                store.ingest(100000 + i % 500, laptop_ids[i % len(laptop_ids)], i % 6)
+            store.flush()
+            results[f'ingest_per_s (fsync каждые {batch})'] = num_events / (time.perf_counter() - start)
+            store.close()
+
+        tmp_ratings = shutil.copy(ratings_csv, os.path.join(tmp_dir, 'ratings_raw.csv'))
+        tmp_laptops = shutil.copy(laptops_csv, os.path.join(tmp_dir, 'laptops_raw.csv'))
+        store = RatingStore(tmp_ratings, tmp_laptops, os.path.join(tmp_dir, 'log_raw.csv'), fsync_batch=fsync_batch)
+        latencies = []
+        for i in range(200):
+            start = time.perf_counter()
+            store.ingest(200000 + i, laptop_ids[i % len(laptop_ids)], 5)
+            store.user_ratings(200000 + i)
+            latencies.append(time.perf_counter() - start)
+        results['read_after_write_ms'] = sum(latencies) / len(latencies) * 1000
+
+        start = time.perf_counter()
+        compacted = store.compact()
+        results['compaction_s'] = time.perf_counter() - start
+        results['compacted_events'] = compacted
+        store.close()
+
+    for key, value in results.items():
+        print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+    return results
+
+
+if __name__ == "__main__":
+    benchmark_ingest('data/generated_ratings.csv', 'data/laptops_with_avg_rating.csv')
@@ -1,15 +1,128 @@
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
-from sklearn.metrics.pairwise import cosine_similarity
-
-
+from scipy import sparse
+import os
+import threading
+from laptop_filters import AttributeIndex, CATEGORY_COLUMNS, top_n_positions, top_n_items
+from neighbor_graph import user_item_matrix, build_neighbor_graph, load_neighbor_graph
+from quantization import quantize_ratings, blocked_user_scores, rated_positions
+from instrumentation import span, count, timed
+from catalog_state import load_scaler_state, fit_scaler_state, minmax_transform, load_state, state_path_for
+
+# scikit-learn импортируется внутри функций: это самый долгий импорт, а при запуске
+# (warmup.py) он не нужен до первого расчета user-user схожести
+
+CONTENT_FEATURES = ['price', 'SSD', 'RAM_GB', 'RAM_Type', 'Display_inch', 'Proc_Cores']
+RATING_SCALE = 5  # максимальная оценка
+
+_cache = {}
+_live_ratings = {}  # путь файла оценок -> RatingStore, оценки которого еще в журнале (rating_store.py)
+
+
+def attach_rating_store(store):
+    # Рекомендации по файлу store.ratings_csv учитывают оверлей хранилища до компактации
+    _live_ratings[store.ratings_csv] = store
+
+
+def _source_version(path):
+    # Время изменения файла; для файла оценок с подключенным хранилищем - еще и версия оверлея
+    mtime = os.path.getmtime(path)
+    store = _live_ratings.get(path)
+    return mtime if store is None else (mtime, store.version)
+
+
+def _read_ratings(ratings_csv):
+    store = _live_ratings.get(ratings_csv)
+    return store.ratings_df() if store is not None else pd.read_csv(ratings_csv)
+
+
+def _cached(name, path, builder):
+    # Кэш по пути и времени изменения файла: при изменении файла данные перестраиваются
+    key = (name, path)
+    mtime = _source_version(path)
+    if key not in _cache or _cache[key][0] != mtime:
+        count(f'cache.{name}.miss')
+        _cache[key] = (mtime, builder())
+    return _cache[key][1]
+
+
+def load_cache(state):
+    # Подстановка готовых записей кэша (см. model_sharing.py); устаревшие отсеет проверка mtime в _cached
+    _cache.update(state)
+
+
+def _get_catalog(csv_path):
+    # Каталог ноутбуков, нормализованная матрица признаков и индексы для фильтров
+    def build():
+        with span('catalog.read_csv'):
+            df = pd.read_csv(csv_path)
+        # Границы нормализации берутся из сохраненного состояния (catalog_state.py),
+        # без него - по всему каталогу, как MinMaxScaler
+        scaler = load_scaler_state(csv_path, CONTENT_FEATURES)
+        if scaler is None:
+            with span('catalog.minmax_fit'):
+                scaler = fit_scaler_state(df, CONTENT_FEATURES, csv_path)
+        with span('catalog.minmax_transform'):
+            feature_matrix, unit_features = _scale_features(df, scaler)
+        with span('catalog.attribute_index'):
+            laptop_id_to_idx = {laptop_id: idx for idx, laptop_id in enumerate(df['id_laptop'])}
+            attribute_index = AttributeIndex(df)
+        return {
+            'df': df,
+            'scaler': scaler,
+            'feature_matrix': feature_matrix,
+            'unit_features': unit_features,
+            'laptop_id_to_idx': laptop_id_to_idx,
+            'attribute_index': attribute_index,
+        }
+    return _cached('catalog', csv_path, build)
+
+
+def _scale_features(df, scaler):
+    feature_matrix = minmax_transform(df[CONTENT_FEATURES], scaler)
+    # Строки единичной длины: косинусная схожесть сводится к скалярному произведению
+    norms = np.linalg.norm(feature_matrix, axis=1, keepdims=True)
+    return feature_matrix, feature_matrix / np.where(norms == 0, 1, norms)
+
+
+def _append_catalog_rows(csv_path, new_rows):
+    # Дописать новые ноутбуки в кэшированный каталог: без чтения файла, обучения нормализатора
+    # и пересортировки индексов. Если каталог еще не загружен, его соберет _get_catalog
+    key = ('catalog', csv_path)
+    if key not in _cache:
+        return
+    catalog = _cache[key][1]
+    new_rows = new_rows.reindex(columns=catalog['df'].columns).reset_index(drop=True)
+    # Типы столбцов - как после чтения файла (например, OS_Bitness после разбора - строка)
+    for col, dtype in catalog['df'].dtypes.items():
+        if pd.api.types.is_numeric_dtype(dtype) and new_rows[col].dtype != dtype:
+            new_rows[col] = pd.to_numeric(new_rows[col]).astype(dtype)
+    feature_matrix, unit_features = _scale_features(new_rows, catalog['scaler'])
+
+    offset = len(catalog['df'])
+    laptop_id_to_idx = dict(catalog['laptop_id_to_idx'])
+    laptop_id_to_idx.update({laptop_id: offset + i for i, laptop_id in enumerate(new_rows['id_laptop'])})
+    updated = {
+        'df': pd.concat([catalog['df'], new_rows], ignore_index=True),
+        'scaler': catalog['scaler'],
+        'feature_matrix': np.vstack([catalog['feature_matrix'], feature_matrix]),
+        'unit_features': np.vstack([catalog['unit_features'], unit_features]),
+        'laptop_id_to_idx': laptop_id_to_idx,
+        'attribute_index': catalog['attribute_index'].extended(new_rows),
+    }
+    # Запись с новым временем файла, чтобы _cached не перестроил каталог целиком
+    _cache[key] = (os.path.getmtime(csv_path), updated)
+    count('catalog.appended_rows', len(new_rows))
+
+
+@timed('recommender.top_rated')
 def get_top_laptops_by_tmdb_rating(laptops_csv, ratings_csv,
                                      id_col='id_laptop', title_col='title', rating_col='user_rating'):
-    # Загрузка ноутбуков
-    laptops_df = pd.read_csv(laptops_csv)
-    # Загрузка оценок
-    ratings_df = pd.read_csv(ratings_csv)
+    with span('top_rated.read_csv'):
+        # Загрузка ноутбуков
+        laptops_df = pd.read_csv(laptops_csv)
+        # Загрузка оценок (с учетом еще не компактированных, если подключено хранилище)
+        ratings_df = _read_ratings(ratings_csv)
 
     # Группируем по ноутбукам: средний рейтинг R и количество голосов v
     ratings_summary = ratings_df.groupby(id_col).agg({rating_col: ['mean', 'count']})
@@ -25,7 +138,8 @@ def get_top_laptops_by_tmdb_rating(laptops_csv, ratings_csv,
         v, R = row['v'], row['R']
         return (v / (v + m)) * R + (m / (v + m)) * C
 
-    ratings_summary['weighted_rating'] = ratings_summary.apply(weighted_rating, axis=1)
+    with span('top_rated.weighted_rating'):
+        ratings_summary['weighted_rating'] = ratings_summary.apply(weighted_rating, axis=1)
 
     # Оставляем ноутбуки с голосами >= m
     qualified = ratings_summary[ratings_summary['v'] >= m]
@@ -41,52 +155,328 @@ def get_top_laptops_by_tmdb_rating(laptops_csv, ratings_csv,
 
 # Пример вызова:
 # get_top_10_laptops_by_tmdb_rating('data/filled_laptops.csv', 'data/generated_ratings.csv')
-def recommend_similar_laptops(csv_path, input_laptop_id, top_n=5):
-    df = pd.read_csv(csv_path)
-    features = ['price', 'SSD', 'RAM_GB', 'RAM_Type', 'Display_inch', 'Proc_Cores']
-
-    # Предобработка признаков
-    scaler = MinMaxScaler()
-    df_scaled = df.copy()
-    df_scaled[features] = scaler.fit_transform(df[features])
-
-    laptop_id_to_idx = {laptop_id: idx for idx, laptop_id in enumerate(df_scaled['id_laptop'])}
+@timed('recommender.similar')
+def _encode_filters(filters, laptops_csv):
+    # Названия категорий в фильтрах ({'OS_Name': 'Windows'}) переводятся в коды каталога
+    # по словарю catalog_state.json; коды передаются как есть, неизвестные названия отклонит индекс
+    if not filters or not any(col in filters for col in CATEGORY_COLUMNS):
+        return filters
+    state_path = state_path_for(laptops_csv)
+    vocabularies = _cached('catalog_vocabulary', state_path, lambda: load_state(state_path)['encodings']) \
+        if os.path.exists(state_path) else {}
+    encoded = dict(filters)
+    for col in CATEGORY_COLUMNS:
+        if col not in filters:
+            continue
+        codes = {name: code for code, name in enumerate(vocabularies.get(col, []))}
+        values = filters[col] if isinstance(filters[col], (list, tuple, set)) else [filters[col]]
+        encoded[col] = [codes.get(value, value) if isinstance(value, str) else value for value in values]
+    return encoded
+
+
+def recommend_similar_laptops(csv_path, input_laptop_id, top_n=5, filters=None):
+    # filters - ограничения на характеристики, см. AttributeIndex.candidate_mask и _encode_filters
+    catalog = _get_catalog(csv_path)
+    df = catalog['df']
+    laptop_id_to_idx = catalog['laptop_id_to_idx']
 
     if input_laptop_id not in laptop_id_to_idx:
         print(f"Ноутбук с id {input_laptop_id} не найден в данных")
         return pd.DataFrame()
 
-    feature_matrix = df_scaled[features].values
+    unit_features = catalog['unit_features']
     laptop_idx = laptop_id_to_idx[input_laptop_id]
 
-    target_features = feature_matrix[laptop_idx].reshape(1, -1)
-    similarity_scores = cosine_similarity(feature_matrix, target_features).flatten()
+    # Кандидаты отбираются по фильтрам до расчета схожести, по одной строке на id, без самого ноутбука
+    laptop_ids = df['id_laptop'].values
+    mask = catalog['attribute_index'].candidate_mask(_encode_filters(filters, csv_path))
+    first_rows = np.zeros(len(df), dtype=bool)
+    first_rows[np.unique(laptop_ids, return_index=True)[1]] = True
+    candidates = np.flatnonzero(mask & first_rows & (laptop_ids != input_laptop_id))
+    if len(candidates) == 0:
+        print("Нет ноутбуков, удовлетворяющих фильтрам")
+        return pd.DataFrame()
 
-    similarity_scores[laptop_idx] = -1  # исключить сам ноутбук
-    similar_idx = similarity_scores.argsort()[-top_n:][::-1]
+    with span('similar.cosine'):
+        similarity_scores = unit_features[candidates] @ unit_features[laptop_idx]
+    count('similar.candidates', len(candidates))
+
+    similar_idx = candidates[top_n_positions(similarity_scores, top_n)]
 
     recommended = df.iloc[similar_idx]
     return recommended[['title', 'price', 'SSD', 'RAM_GB', 'RAM_Type', 'Display_inch', 'Proc_Cores','id_laptop']]
 
 
-def recommend_laptops_for_user(user_id, laptops_csv, ratings_csv, top_n=5):
+def build_item_similarity(ratings_csv, k=20, save_path=None):
+    # Разреженная матрица top-K косинусной схожести между ноутбуками по оценкам пользователей
+    ratings = _read_ratings(ratings_csv)
+
+    user_ids, user_idx = np.unique(ratings['id_user'].values, return_inverse=True)
+    item_ids, item_idx = np.unique(ratings['id_laptop'].values, return_inverse=True)
+    item_user = sparse.csr_matrix(
+        (ratings['user_rating'].values.astype(np.float64), (item_idx, user_idx)),
+        shape=(len(item_ids), len(user_ids))
+    )
+
+    # Нормируем строки, тогда произведение матриц дает косинусную схожесть
+    norms = np.sqrt(item_user.multiply(item_user).sum(axis=1)).A1
+    norms[norms == 0] = 1
+    item_user = sparse.diags(1 / norms) @ item_user
+    sim = (item_user @ item_user.T).tocsr()
+    sim.setdiag(0)
+    sim.eliminate_zeros()
+
+    # Оставляем только k ближайших соседей для каждого ноутбука
+    rows, cols, vals = [], [], []
+    for i in range(sim.shape[0]):
+        start, end = sim.indptr[i], sim.indptr[i + 1]
+        row_vals = sim.data[start:end]
+        row_cols = sim.indices[start:end]
+        if len(row_vals) > k:
+            keep = np.argpartition(-row_vals, k - 1)[:k]
+            row_vals, row_cols = row_vals[keep], row_cols[keep]
+        rows.append(np.full(len(row_vals), i))
+        cols.append(row_cols)
+        vals.append(row_vals)
+    top_k = sparse.csr_matrix(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+        shape=sim.shape, dtype=np.float32
+    )
+
+    if save_path:
+        np.savez(save_path, data=top_k.data, indices=top_k.indices, indptr=top_k.indptr,
+                 shape=top_k.shape, item_ids=item_ids)
+        print(f"Матрица схожести ноутбуков сохранена в файл: {save_path}")
+
+    return top_k, item_ids
+
+
+def load_item_similarity(path):
+    with np.load(path) as data:
+        sim = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+        return sim, data['item_ids']
+
+
+_stale_item_similarity = set()  # файлы схожести, о которых уже предупредили
+
+
+def _get_item_similarity(ratings_csv, item_similarity_path=None):
+    # Предрасчитанная матрица с диска, если она построена по тем же ноутбукам, что и текущие оценки;
+    # иначе строим по оценкам (с учетом оверлея хранилища). В обоих случаях кэшируем
+    if item_similarity_path and os.path.exists(item_similarity_path):
+        sim, item_ids = _cached('item_similarity', item_similarity_path,
+                                lambda: load_item_similarity(item_similarity_path))
+        if np.array_equal(item_ids, _get_user_item(ratings_csv)[2]):
+            return sim, item_ids
+        if item_similarity_path not in _stale_item_similarity:
+            _stale_item_similarity.add(item_similarity_path)
+            print(f"Матрица схожести {item_similarity_path} устарела (изменился набор оцененных ноутбуков), "
+                  f"используется построенная по текущим оценкам; обновить файл: python recomendation_system.py")
+    return _cached('item_similarity', ratings_csv, lambda: build_item_similarity(ratings_csv))
+
+
+def _score_items_for_user(rated_ids, rated_values, sim, item_ids):
+    # Агрегируем только соседей тех немногих ноутбуков, которые пользователь оценил
+    known = np.isin(rated_ids, item_ids)
+    rated_pos = np.searchsorted(item_ids, rated_ids[known])
+    neighbors = sim[rated_pos]
+
+    numerator = neighbors.T @ rated_values[known].astype(np.float64)
+    denominator = np.asarray(np.abs(neighbors).sum(axis=0)).ravel()
+
+    scores = {}
+    for pos in np.flatnonzero(denominator > 0):
+        scores[item_ids[pos]] = numerator[pos] / denominator[pos]
+    for laptop in rated_ids:
+        scores.pop(laptop, None)
+    return scores
+
+
+def _get_user_item(ratings_csv):
+    return _cached('user_item', ratings_csv, lambda: user_item_matrix(_read_ratings(ratings_csv)))
+
+
+def _user_item_stats(user_item):
+    # Нормы строк и маска оцененных ноутбуков (те же индексы, значения 1) для полного расчета схожести
+    norms = np.sqrt(user_item.multiply(user_item).sum(axis=1)).A1
+    rated_mask = sparse.csr_matrix((np.ones(user_item.nnz), user_item.indices, user_item.indptr),
+                                   shape=user_item.shape)
+    return norms, rated_mask
+
+
+def _get_user_item_stats(ratings_csv):
+    return _cached('user_item_stats', ratings_csv, lambda: _user_item_stats(_get_user_item(ratings_csv)[0]))
+
+
+def _get_neighbor_graph(ratings_csv, neighbor_graph_path):
+    # Граф годится, только если построен по тем же пользователям, что и текущие оценки;
+    # устаревший граф перестраивается в фоне, а до замены используется полный разреженный расчет
+    if not neighbor_graph_path or not os.path.exists(neighbor_graph_path):
+        return None
+    graph, graph_user_ids = _cached('neighbor_graph', neighbor_graph_path,
+                                    lambda: load_neighbor_graph(neighbor_graph_path))
+    user_ids = _get_user_item(ratings_csv)[1]
+    if not np.array_equal(graph_user_ids, user_ids):
+        _rebuild_neighbor_graph(ratings_csv, neighbor_graph_path, k=int(np.diff(graph.indptr).max(initial=1)))
+        return None
+    return graph
+
+
+_graph_rebuilds = set()  # пути графов, которые сейчас перестраиваются
+_graph_rebuild_lock = threading.Lock()
+
+
+def _rebuild_neighbor_graph(ratings_csv, neighbor_graph_path, k):
+    # Одна фоновая перестройка на файл графа; новый файл подхватит _cached по времени изменения
+    with _graph_rebuild_lock:
+        if neighbor_graph_path in _graph_rebuilds:
+            return
+        _graph_rebuilds.add(neighbor_graph_path)
+    print(f"Граф соседей {neighbor_graph_path} устарел: перестраивается в фоне, "
+          f"пока используется полный расчет схожести")
+
+    def run():
+        try:
+            build_neighbor_graph(ratings_csv, k=k, save_path=neighbor_graph_path,
+                                 ratings_df=_read_ratings(ratings_csv))
+        except Exception as e:
+            print(f"Ошибка перестройки графа соседей: {e}")
+        finally:
+            with _graph_rebuild_lock:
+                _graph_rebuilds.discard(neighbor_graph_path)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def _graph_numerator_denominator(user_pos, graph, user_item):
+    # Взвешенная сумма оценок top-K соседей из графа и сумма весов соседей, оценивших ноутбук
+    neighbors = graph[user_pos]
+    weights = neighbors.data.astype(np.float64)
+    neighbor_ratings = user_item[neighbors.indices]
+    rated_mask = neighbor_ratings.copy()
+    rated_mask.data[:] = 1
+    return neighbor_ratings.T @ weights, rated_mask.T @ weights
+
+
+def _full_numerator_denominator(user_pos, user_item, stats=None):
+    # То же по всем пользователям: косинусная схожесть считается одним разреженным произведением;
+    # stats - результат _user_item_stats, без него нормы и маска считаются заново
+    norms, rated_mask = stats if stats is not None else _user_item_stats(user_item)
+    dots = (user_item @ user_item[user_pos].T).toarray().ravel()
+    norm_products = norms * norms[user_pos]
+    # Пользователь без ненулевых оценок ни на кого не похож, как в cosine_similarity
+    sims = np.divide(dots, norm_products, out=np.zeros_like(dots), where=norm_products > 0)
+    sims[user_pos] = 0
+    return user_item.T @ sims, rated_mask.T @ sims
+
+
+def _score_user(user_pos, numerator, denominator, user_item, item_ids, allowed):
+    # Прогноз - взвешенное среднее оценок соседей, для еще не оцененных ноутбуков из allowed
+    already_rated = set(user_item[user_pos].indices)
+    scores = {}
+    for pos in np.flatnonzero(denominator > 0):
+        if pos not in already_rated and item_ids[pos] in allowed:
+            scores[item_ids[pos]] = numerator[pos] / denominator[pos]
+    return scores
+
+
+def _score_user_compact(user_pos, quantized_ratings, item_ids, allowed):
+    # Та же формула, что и в полном расчете, но по оценкам в int8 и блоками пользователей
+    numerator, denominator = blocked_user_scores(quantized_ratings, user_pos)
+    unrated = np.ones(len(item_ids), dtype=bool)
+    unrated[rated_positions(quantized_ratings, user_pos)] = False
+    scores = {}
+    for pos in np.flatnonzero((denominator > 0) & unrated):
+        if item_ids[pos] in allowed:
+            scores[item_ids[pos]] = float(numerator[pos] / denominator[pos])
+    return scores
+
+
+@timed('recommender.user')
+def recommend_laptops_for_user(user_id, laptops_csv, ratings_csv, top_n=5, mode='user',
+                               item_similarity_path=None, filters=None, neighbor_graph_path=None,
+                               compact=False, alpha=0.7):
+    # mode='user' - схожесть пользователей, mode='item' - предрасчитанная схожесть ноутбуков
+    # neighbor_graph_path - граф top-K соседей (neighbor_graph.py) вместо расчета схожести со всеми
+    # compact - полный расчет user-user по матрице оценок в int8 (quantization.py)
+    # mode='hybrid' - смешивание CF и контентной схожести, см. _recommend_hybrid
+    if mode not in ('user', 'item', 'hybrid'):
+        raise ValueError(f"Неизвестный режим рекомендаций: {mode}")
+
     # Загрузка данных
-    laptops = pd.read_csv(laptops_csv)
-    ratings = pd.read_csv(ratings_csv)
+    catalog = _get_catalog(laptops_csv)
+    laptops = catalog['df']
+
+    filters = _encode_filters(filters, laptops_csv)
+    if mode == 'hybrid':
+        return _recommend_hybrid(user_id, catalog, ratings_csv, top_n, alpha, filters, neighbor_graph_path)
+
+    # Ноутбуки каталога, удовлетворяющие фильтрам - только они оцениваются
+    allowed = set(laptops['id_laptop'].values[catalog['attribute_index'].candidate_mask(filters)])
+
+    graph = _get_neighbor_graph(ratings_csv, neighbor_graph_path) if mode == 'user' else None
+    if graph is not None or (mode == 'user' and neighbor_graph_path and not compact):
+        user_item, user_ids, item_ids = _get_user_item(ratings_csv)
+        user_pos = np.searchsorted(user_ids, user_id)
+        if user_pos >= len(user_ids) or user_ids[user_pos] != user_id:
+            print("Пользователь не найден в данных.")
+            return pd.DataFrame()
+        # Только top-K соседей из графа; если графа нет или он устарел - все пользователи,
+        # тоже по разреженной матрице, без плотной матрицы схожести N x N
+        with span('user.graph_scoring' if graph is not None else 'user.sparse_scoring'):
+            if graph is not None:
+                numerator, denominator = _graph_numerator_denominator(user_pos, graph, user_item)
+            else:
+                numerator, denominator = _full_numerator_denominator(user_pos, user_item,
+                                                                     _get_user_item_stats(ratings_csv))
+            scores = _score_user(user_pos, numerator, denominator, user_item, item_ids, allowed)
+        return _format_user_recommendations(laptops, scores, top_n)
+
+    if mode == 'user' and compact:
+        user_item, user_ids, item_ids = _get_user_item(ratings_csv)
+        user_pos = np.searchsorted(user_ids, user_id)
+        if user_pos >= len(user_ids) or user_ids[user_pos] != user_id:
+            print("Пользователь не найден в данных.")
+            return pd.DataFrame()
+        quantized_ratings = _cached('user_item_int8', ratings_csv, lambda: quantize_ratings(user_item))
+        with span('user.compact_scoring'):
+            scores = _score_user_compact(user_pos, quantized_ratings, item_ids, allowed)
+        return _format_user_recommendations(laptops, scores, top_n)
+
+    if mode == 'item':
+        # Оценки пользователя - строка кэшированной матрицы оценок, без чтения файла на каждый запрос
+        user_item, user_ids, rated_item_ids = _get_user_item(ratings_csv)
+        user_pos = np.searchsorted(user_ids, user_id)
+        if user_pos >= len(user_ids) or user_ids[user_pos] != user_id:
+            print("Пользователь не найден в данных.")
+            return pd.DataFrame()
+        user_row = user_item[user_pos]
+        sim, item_ids = _get_item_similarity(ratings_csv, item_similarity_path)
+        with span('item.scoring'):
+            scores = _score_items_for_user(rated_item_ids[user_row.indices], user_row.data, sim, item_ids)
+        scores = {laptop: score for laptop, score in scores.items() if laptop in allowed}
+        return _format_user_recommendations(laptops, scores, top_n)
+
+    with span('user.read_csv'):
+        ratings = _read_ratings(ratings_csv)
+
+    from sklearn.metrics.pairwise import cosine_similarity
 
     # Матрица предпочтений
-    user_item = ratings.pivot(index='id_user', columns='id_laptop', values='user_rating').fillna(0)
+    with span('user.pivot'):
+        user_item = ratings.pivot(index='id_user', columns='id_laptop', values='user_rating').fillna(0)
 
     if user_id not in user_item.index:
         print("Пользователь не найден в данных.")
         return pd.DataFrame()
 
     # Считаем косинусную схожесть между пользователями
-    user_sim_matrix = pd.DataFrame(
-        cosine_similarity(user_item),
-        index=user_item.index,
-        columns=user_item.index
-    )
+    with span('user.cosine'):
+        user_sim_matrix = pd.DataFrame(
+            cosine_similarity(user_item),
+            index=user_item.index,
+            columns=user_item.index
+        )
 
     # Получаем оценки данного пользователя
     user_ratings = user_item.loc[user_id]
@@ -98,28 +488,100 @@ def recommend_laptops_for_user(user_id, laptops_csv, ratings_csv, top_n=5):
     sim_scores = sim_scores.drop(user_id)
 
     # Вычисляем взвешенные оценки для ноутбуков, которые пользователь еще не оценил
-    unrated_laptops = user_ratings[user_ratings == 0].index
+    unrated_laptops = [laptop for laptop in user_ratings[user_ratings == 0].index if laptop in allowed]
     scores = {}
-    for laptop in unrated_laptops:
-        # Оценки ноутбука другими пользователями
-        ratings_for_laptop = user_item[laptop]
-
-        # Взвешенная сумма оценок
-        numerator = (ratings_for_laptop * sim_scores).sum()
-        denominator = sim_scores[ratings_for_laptop > 0].sum()
-
-        if denominator > 0:
-            scores[laptop] = numerator / denominator
+    with span('user.scoring_loop'):
+        for laptop in unrated_laptops:
+            # Оценки ноутбука другими пользователями
+            ratings_for_laptop = user_item[laptop]
+
+            # Взвешенная сумма оценок
+            numerator = (ratings_for_laptop * sim_scores).sum()
+            denominator = sim_scores[ratings_for_laptop > 0].sum()
+
+            if denominator > 0:
+                scores[laptop] = numerator / denominator
+    count('user.scored_laptops', len(unrated_laptops))
+
+    return _format_user_recommendations(laptops, scores, top_n)
+
+
+def _recommend_hybrid(user_id, catalog, ratings_csv, top_n, alpha, filters, neighbor_graph_path,
+                      like_threshold=4):
+    """
+    Гибрид за один векторный проход по кандидатам: alpha * прогноз CF (в шкале 0-1)
+    + (1 - alpha) * максимальная косинусная схожесть с ноутбуками, которые пользователь оценил
+    на like_threshold и выше. Все матрицы берутся из кэша.
+    """
+    user_item, user_ids, item_ids = _get_user_item(ratings_csv)
+    user_pos = np.searchsorted(user_ids, user_id)
+    if user_pos >= len(user_ids) or user_ids[user_pos] != user_id:
+        print("Пользователь не найден в данных.")
+        return pd.DataFrame()
 
+    df = catalog['df']
+    laptop_ids = df['id_laptop'].values
+
+    # Кандидаты: строки каталога под фильтрами, по одной строке на id, без уже оцененных
+    rated_row = user_item[user_pos]
+    rated_ids = item_ids[rated_row.indices]
+    mask = catalog['attribute_index'].candidate_mask(filters)
+    first_rows = np.zeros(len(df), dtype=bool)
+    first_rows[np.unique(laptop_ids, return_index=True)[1]] = True
+    candidates = np.flatnonzero(mask & first_rows & ~np.isin(laptop_ids, rated_ids))
+    if len(candidates) == 0:
+        return pd.DataFrame(columns=['id_laptop', 'title', 'predicted_rating'])
+
+    with span('hybrid.scoring'):
+        # CF: числитель и знаменатель по всем ноутбукам сразу
+        graph = _get_neighbor_graph(ratings_csv, neighbor_graph_path)
+        if graph is not None:
+            numerator, denominator = _graph_numerator_denominator(user_pos, graph, user_item)
+        else:
+            numerator, denominator = _full_numerator_denominator(user_pos, user_item,
+                                                                 _get_user_item_stats(ratings_csv))
+        item_pos = np.searchsorted(item_ids, laptop_ids[candidates]).clip(max=len(item_ids) - 1)
+        known = item_ids[item_pos] == laptop_ids[candidates]
+        cand_den = np.where(known, denominator[item_pos], 0)
+        cf = np.divide(np.where(known, numerator[item_pos], 0), cand_den,
+                       out=np.full(len(candidates), np.nan), where=cand_den > 0) / RATING_SCALE
+
+        # Контент: схожесть с понравившимися ноутбуками (если таких нет - со всеми оцененными)
+        liked = rated_ids[rated_row.data >= like_threshold]
+        liked = liked if len(liked) else rated_ids
+        liked_rows = [catalog['laptop_id_to_idx'][i] for i in liked if i in catalog['laptop_id_to_idx']]
+        unit_features = catalog['unit_features']
+        if liked_rows:
+            content = (unit_features[candidates] @ unit_features[liked_rows].T).max(axis=1)
+        else:
+            content = np.zeros(len(candidates))
+
+        # У редких пользователей CF покрывает мало ноутбуков: там, где прогноза нет,
+        # подставляется средняя оценка, и такие ноутбуки упорядочиваются контентной частью
+        prior = user_item.data.mean() / RATING_SCALE if user_item.nnz else 0
+        hybrid = alpha * np.where(np.isnan(cf), prior, cf) + (1 - alpha) * content
+
+    top = candidates[top_n_positions(hybrid, top_n)]
+    scores = dict(zip(laptop_ids[candidates], hybrid * RATING_SCALE))
+    rec_df = df.iloc[top][['id_laptop', 'title']].copy()
+    rec_df['predicted_rating'] = rec_df['id_laptop'].map(scores)
+    return rec_df
+
+
+def _format_user_recommendations(laptops, scores, top_n):
     # Сортируем рекомендуемые ноутбуки по рейтингу
-    recommended = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_n]
+    recommended = top_n_items(scores, top_n)
 
     recommended_ids = [r[0] for r in recommended]
     recommended_scores = [r[1] for r in recommended]
 
     # Формируем датафрейм с рекомендациями и названиями ноутбуков
-    rec_df = laptops[laptops['id_laptop'].isin(recommended_ids)].copy()
+    rec_df = laptops[laptops['id_laptop'].isin(recommended_ids)].drop_duplicates('id_laptop').copy()
     rec_df['predicted_rating'] = rec_df['id_laptop'].map(dict(zip(recommended_ids, recommended_scores)))
     rec_df = rec_df.sort_values('predicted_rating', ascending=False)
 
-    return rec_df[['id_laptop', 'title', 'predicted_rating']]
\ No newline at end of file
+    return rec_df[['id_laptop', 'title', 'predicted_rating']]
+
+
+if __name__ == "__main__":
+    build_item_similarity('data/generated_ratings.csv', k=20, save_path='data/item_similarity.npz')
@@ -0,0 +1,52 @@
+import sys
+import json
+import time
+import subprocess
+
+# Код, выполняемый в отдельном процессе, чтобы каждый запуск был с пустым кэшем импортов.
+# Без дисплея окно не создается и замеряется только импорт main.py и фоновая загрузка.
+_CHILD_CODE = """
+import os, sys, json, time
+import instrumentation
+instrumentation.enable()
+start = time.perf_counter()
+import main
+result = {'import_main_s': time.perf_counter() - start}
+if os.environ.get('DISPLAY') or sys.platform in ('win32', 'darwin'):
+    root = main.tk.Tk()
+    app = main.App(root)
+    root.update()
+    result['login_drawn_s'] = time.perf_counter() - start
+    warmup = app.warmup
+else:
+    warmup = main.Warmup().start()
+warmup.wait()
+result['data_ready_s'] = time.perf_counter() - start
+# Импорт pandas и scipy - большая часть загрузки, остальное - чтение CSV и прогрев кэшей
+spans = instrumentation.snapshot()['spans']
+result['imports_s'] = spans['startup.imports']['total_s']
+result['data_after_imports_s'] = result['data_ready_s'] - result['import_main_s'] - result['imports_s']
+instrumentation.enable(False)
+print(json.dumps(result))
+"""
+
+
+def run_startup():
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', _CHILD_CODE], capture_output=True, text=True, check=True)
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result['process_total_s'] = time.perf_counter() - start
+    return result
+
+
+def benchmark_startup(repeats=3):
+    """Время запуска: импорт main.py, окно входа и готовность данных (с импортом pandas и scipy отдельно)"""
+    runs = [run_startup() for _ in range(repeats)]
+    for key in runs[0]:
+        values = [run[key] for run in runs]
+        print(f"{key}: {min(values) * 1000:.1f} мс (min), {sum(values) / len(values) * 1000:.1f} мс (avg)")
+    return runs
+
+
+if __name__ == "__main__":
+    benchmark_startup()
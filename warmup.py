@@ -0,0 +1,66 @@
+import os
+import threading
+from instrumentation import span
+
+# Тяжелые модули (pandas, scikit-learn) импортируются только внутри load_app_data,
+# чтобы окно входа появлялось сразу, а загрузка шла в фоне
+
+DATA_FILES = {
+    'ratings_df': 'data/generated_ratings.csv',
+    'laptops_df': 'data/laptops_with_avg_rating.csv',
+    'laptops_specs_df': 'data/cleaned_warranty_laptops.csv',
+}
+ITEM_SIMILARITY_PATH = 'data/item_similarity.npz'
+NEIGHBOR_GRAPH_PATH = 'data/user_neighbors.npz'
+SEGMENT_POPULARITY_PATH = 'data/segment_popularity.csv'
+
+
+def load_app_data():
+    """
+    Загрузка данных приложения и прогрев рекомендательных движков.
+    Возвращает словарь с датафреймами ratings_df, laptops_df, laptops_specs_df
+    и топами по сегментам leaderboards (None, если файл не построен).
+    """
+    with span('startup.imports'):
+        import pandas as pd
+        import recomendation_system
+        from popularity import load_segment_leaderboards
+
+    with span('startup.load_csv'):
+        frames = {name: pd.read_csv(path) for name, path in DATA_FILES.items()}
+        frames['leaderboards'] = load_segment_leaderboards(SEGMENT_POPULARITY_PATH) \
+            if os.path.exists(SEGMENT_POPULARITY_PATH) else None
+
+    # Прогрев кэшей: матрица признаков, индексы фильтров, схожесть ноутбуков и граф соседей
+    with span('startup.engine_warmup'):
+        recomendation_system._get_catalog(DATA_FILES['laptops_df'])
+        recomendation_system._get_item_similarity(DATA_FILES['ratings_df'], ITEM_SIMILARITY_PATH)
+        recomendation_system._get_neighbor_graph(DATA_FILES['ratings_df'], NEIGHBOR_GRAPH_PATH)
+    return frames
+
+
+class Warmup:
+    """Фоновая загрузка данных; ready выставляется и при успехе, и при ошибке"""
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.data = None
+        self.error = None
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        try:
+            self.data = load_app_data()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.ready.set()
+
+    def wait(self, timeout=None):
+        self.ready.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.data